@@ -0,0 +1,208 @@
+"""Benchmarks of the revisor actions against a local fake gitlab.
+
+Usage:
+  bench.py [options]
+
+Options:
+  -h --help                 Show this screen.
+  --groups=<number>         Groups of the organization [default: 50]
+  --depth=<depth>           Deepest nesting of subgroups [default: 3]
+  --projects=<number>       Projects of the organization [default: 500]
+  --variants=<number>       Different CI files shared by the projects [default: 5]
+  --branches=<number>       Branches of every project [default: 3]
+  --latency=<ms>            Milliseconds added to every response of the server [default: 0]
+  --rate-limit=<rps>        Requests per second the server answers before 429, 0 for none [default: 0]
+  -c --concurrency=<number>  Workers of the actions [default: 8]
+  --throttle=<rpm>          Requests per minute of the client, 0 for none [default: 0]
+  --benchmarks=<csl>        Benchmarks to run {tree, flat, filter, plugins, graphql, push, branch, clone} [default: tree,flat,filter,plugins,graphql,push,branch,clone]
+  --include=<csl>           Include patterns of the filter benchmark [default: /group-1**,/group-2**]
+  --repeat=<number>         Runs of every benchmark, the fastest is reported [default: 1]
+  --memory                  Trace the peak of python allocations, slower
+  --seed=<seed>             Seed of the generated organization [default: 1]
+"""
+from contextlib import redirect_stdout
+from urllib.request import urlopen
+from docopt import docopt
+import importlib.util
+import subprocess
+import tracemalloc
+import tempfile
+import logging
+import json
+import time
+import sys
+import os
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Benchmarks that load the whole organization, they have to agree on its projects
+LOADERS = ('tree', 'flat')
+REVISOR = os.path.join(os.path.dirname(HERE), 'revisor')
+sys.path.insert(0, REVISOR)
+
+from progress import ProgressBar
+from tree import Tree
+import treeio
+
+
+def load_revisor():
+    # The script name has a dash, it can only be imported from its path
+    spec = importlib.util.spec_from_file_location('revisor_main', os.path.join(REVISOR, 'pipeline-revision.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+revisor = load_revisor()
+logging.getLogger().setLevel(logging.WARNING)
+
+
+class Server:
+    def __init__(self, arguments, repos):
+        command = [sys.executable, os.path.join(HERE, 'fakegitlab.py'), '--repos', repos]
+        for option in ('--groups', '--depth', '--projects', '--variants', '--branches', '--latency', '--rate-limit',
+                       '--seed'):
+            command += [option, arguments[option]]
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, universal_newlines=True)
+        self.url = self.process.stdout.readline().strip()
+        if not self.url:
+            raise RuntimeError("The fake gitlab did not start")
+
+    def call(self, path):
+        with urlopen(self.url + path) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+class Benchmark:
+    def __init__(self, server, arguments, workdir):
+        self.server = server
+        self.concurrency = arguments["--concurrency"]
+        self.throttle = arguments["--throttle"]
+        self.includes = arguments["--include"].split(',')
+        self.workdir = workdir
+        self.snapshot = os.path.join(workdir, 'tree.jsonl')
+        # Projects a benchmark has to end up with, when another loader can tell
+        self.expected = {}
+
+    def revisor_arguments(self, *command):
+        arguments = docopt(revisor.__doc__, argv=['-g', self.server.url, '-t', 'bench', '-c', self.concurrency,
+                                                  '--throttle', self.throttle] + list(command))
+        revisor.setup(arguments, self.server.url, 'bench')
+        return arguments
+
+    def tree(self, arguments, **kwargs):
+        kwargs.setdefault('includes', revisor.include_paths(arguments["--include"]))
+        tree = Tree(self.server.url, arguments["gitlab"], excludes=revisor.exclude_paths(arguments["--exclude"]),
+                    concurrency=int(self.concurrency), **kwargs)
+        tree.disable_progress = True
+        tree.progress = ProgressBar('* loading tree', True)
+        return tree
+
+    def loaded_tree(self, arguments):
+        tree = self.tree(arguments, in_file=self.snapshot) if os.path.exists(self.snapshot) else self.tree(arguments)
+        tree.load_tree()
+        if not os.path.exists(self.snapshot):
+            with open(self.snapshot, 'w') as stream:
+                treeio.write_jsonl(tree.root, stream)
+        return tree
+
+    # Every benchmark prepares what it needs and returns the timed work with the number of projects
+
+    def prepare_tree(self):
+        tree = self.tree(self.revisor_arguments('clone', self.workdir))
+        return lambda: tree.load_tree() or tree.count()[0]
+
+    def prepare_flat(self):
+        tree = self.tree(self.revisor_arguments('clone', self.workdir), flat=True)
+        return lambda: tree.load_tree() or tree.count()[0]
+
+    def prepare_filter(self):
+        arguments = self.revisor_arguments('clone', self.workdir)
+        self.loaded_tree(arguments)
+        # Pruning while crawling has the same rules, it has to keep the same projects
+        crawled = self.tree(arguments, includes=self.includes)
+        crawled.load_tree()
+        self.expected['filter'] = crawled.count()[0]
+        tree = self.tree(arguments, in_file=self.snapshot, includes=self.includes)
+        tree.load_tree_from_file()
+        return lambda: tree.filter_tree(tree.root) and tree.count()[0]
+
+    def prepare_action(self, action, *command):
+        arguments = self.revisor_arguments(*command)
+        tree = self.loaded_tree(arguments)
+        return lambda: tree.sync_tree(action, arguments) or tree.count()[0]
+
+    def prepare_plugins(self):
+        return self.prepare_action('plugins', 'plugins', '--check', '--name=main')
+
+    def prepare_graphql(self):
+        return self.prepare_action('plugins', '--graphql', 'plugins', '--check', '--name=main')
+
+    def prepare_push(self):
+        # The first run creates the branch with every commit, the next ones find nothing to change
+        return self.prepare_action('plugins', 'plugins', '--push', '--name=revisor-bench', '--ref=main')
+
+    def prepare_branch(self):
+        return self.prepare_action('branch', 'branch', '--list')
+
+    def prepare_clone(self):
+        path = tempfile.mkdtemp(prefix='clone-', dir=self.workdir)
+        return self.prepare_action('clone', 'clone', path)
+
+    def run(self, name, memory=False):
+        work = getattr(self, 'prepare_' + name)()
+        self.server.call('/_reset')
+        if memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            projects = work()
+        seconds = time.perf_counter() - start
+        peak = None
+        if memory:
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        stats = self.server.call('/_stats')
+        return {'benchmark': name, 'seconds': seconds, 'projects': projects, 'requests': stats['total'],
+                'throttled': stats['throttled'], 'peak': peak}
+
+
+def print_results(results):
+    print("{:<10} {:>9} {:>9} {:>11} {:>9} {:>9} {:>9}".format(
+        'benchmark', 'seconds', 'projects', 'projects/s', 'requests', 'throttled', 'peak MB'))
+    for result in results:
+        print("{benchmark:<10} {seconds:>9.3f} {projects:>9} {rate:>11.1f} {requests:>9} {throttled:>9} {peak:>9}".format(
+            **dict(result, rate=result['projects'] / result['seconds'] if result['seconds'] else 0.0,
+                   peak="-" if result['peak'] is None else "{:.1f}".format(result['peak']))))
+
+
+def mismatched(results, expected):
+    counts = {result['benchmark']: result['projects'] for result in results if result['benchmark'] in LOADERS}
+    if len(set(counts.values())) > 1:
+        return counts
+    wrong = {result['benchmark']: (result['projects'], expected[result['benchmark']]) for result in results
+             if result['benchmark'] in expected and result['projects'] != expected[result['benchmark']]}
+    return {name: "{} instead of {}".format(*counts) for name, counts in wrong.items()} or None
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    with tempfile.TemporaryDirectory(prefix='revisor-bench-') as workdir:
+        server = Server(arguments, os.path.join(workdir, 'repos'))
+        try:
+            benchmark = Benchmark(server, arguments, workdir)
+            results = []
+            for name in arguments["--benchmarks"].split(','):
+                runs = [benchmark.run(name, arguments["--memory"]) for _ in range(int(arguments["--repeat"]))]
+                results.append(min(runs, key=lambda result: result['seconds']))
+        finally:
+            server.stop()
+    print_results(results)
+    counts = mismatched(results, benchmark.expected)
+    if counts is not None:
+        print("Loaders disagree on the projects of the organization: {}".format(
+            ", ".join("{} {}".format(name, num) for name, num in counts.items())), file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,511 @@
+"""Local stand-in for the gitlab REST API, serving a synthetic organization.
+
+Usage:
+  fakegitlab.py [options]
+
+Options:
+  -h --help                 Show this screen.
+  --port=<port>             Port to listen on, 0 for any free port [default: 0]
+  --groups=<number>         Groups of the organization [default: 50]
+  --depth=<depth>           Deepest nesting of subgroups [default: 3]
+  --projects=<number>       Projects of the organization [default: 500]
+  --variants=<number>       Different CI files shared by the projects [default: 5]
+  --branches=<number>       Branches of every project [default: 3]
+  --latency=<ms>            Milliseconds added to every response [default: 0]
+  --rate-limit=<rps>        Requests per second before answering 429, 0 for none [default: 0]
+  --repos=<dir>             Directory with a bare repository per CI variant, the clone urls point there
+  --seed=<seed>             Seed of the generated organization [default: 1]
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+from collections import Counter, deque
+from fnmatch import fnmatchcase
+from docopt import docopt
+import subprocess
+import threading
+import tempfile
+import hashlib
+import base64
+import random
+import json
+import time
+import sys
+import os
+import re
+
+API = '/api/v4'
+GRAPHQL = '/api/graphql'
+# Largest page of a connection gitlab answers, whatever first asks for
+GRAPHQL_PAGE = 100
+LANGUAGES = ['Java', 'JavaScript', 'Python', 'Go', 'Kotlin', 'Shell', 'HTML']
+IMAGES = ['node:10', 'node:14', 'openjdk:11', 'python:3.8', 'golang:1.15', 'alpine:3.12']
+TEMPLATE_PROJECT = 'platform/ci-templates'
+TEMPLATE_FILE = '/templates/build.yml'
+TEMPLATES = {
+    'Security/SAST': "sast:\n  stage: test\n  image: sast:latest\n  script:\n  - analyze\n",
+    'Security/Secret-Detection': "secret_detection:\n  stage: test\n  image: secrets:latest\n  script:\n  - scan\n",
+}
+
+
+def blob_sha(text):
+    data = text.encode('utf-8')
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def ci_variant(index, rng):
+    # Variants differ in images, includes and in having the veracode job already
+    image = IMAGES[index % len(IMAGES)]
+    lines = ["image: {}".format(image), "stages:", "- build", "- test"]
+    includes = []
+    if index % 2 == 0:
+        includes.append("- project: {}\n  file: {}\n  ref: v{}".format(TEMPLATE_PROJECT, TEMPLATE_FILE, 1 + index % 3))
+    if index % 3 == 0:
+        includes.append("- template: Security/SAST.gitlab-ci.yml")
+    if includes:
+        lines += ["include:"] + includes
+    lines += ["variables:", "  GRADLE_OPTS: -Xmx{}m".format(512 * (1 + index % 4)) if index % 2 else "  NPM_CONFIG_CACHE: .npm",
+              "build:", "  stage: build", "  script:", "  - make build-{}".format(index)]
+    for job in range(rng.randint(1, 4)):
+        lines += ["test-{}:".format(job), "  stage: test", "  script:", "  - make test-{}".format(job)]
+    if index % 4 == 3:
+        lines += ["veracode-analysis:", "  extends: .veracode", "  stage: test", "  script:", "  - scan"]
+    return "\n".join(lines) + "\n"
+
+
+class Organization:
+    def __init__(self, groups=50, depth=3, projects=500, variants=5, branches=3, repos=None, seed=1):
+        rng = random.Random(seed)
+        self.groups = []
+        self.projects = []
+        self.variants = [ci_variant(index, rng) for index in range(max(variants, 1))]
+        self.template = "lint:\n  stage: test\n  image: python:3.8\n  script:\n  - lint\n"
+        self.repos = repos
+        self.lock = threading.Lock()
+        for id in range(1, groups + 1):
+            parents = [group for group in self.groups if group['depth'] < depth]
+            # A handful of top level groups, the rest nest below them
+            parent = rng.choice(parents) if parents and (id > max(groups // 10, 1)) else None
+            name = "group-{}".format(id)
+            full_path = name if parent is None else "{}/{}".format(parent['full_path'], name)
+            self.groups.append({'id': id, 'name': name, 'path': name, 'full_path': full_path,
+                                'parent_id': parent['id'] if parent else None,
+                                'depth': 1 if parent is None else parent['depth'] + 1})
+        self.group_ids = {group['id']: group for group in self.groups}
+        for id in range(1, projects + 1):
+            group = rng.choice(self.groups)
+            variant = rng.randrange(len(self.variants))
+            name = "project-{}".format(id)
+            languages = rng.sample(LANGUAGES, 2)
+            share = round(rng.uniform(50, 99), 1)
+            names = ['main'] + ["feature-{}".format(b) for b in range(1, branches)]
+            if rng.random() < 0.3:
+                names.append('devsecops')
+            self.projects.append({
+                'id': id, 'name': name, 'path': name, 'group': group['id'], 'variant': variant,
+                'path_with_namespace': "{}/{}".format(group['full_path'], name),
+                'last_activity_at': "2020-0{}-1{}T10:00:00.000Z".format(1 + id % 9, id % 10),
+                'languages': {languages[0]: share, languages[1]: round(100 - share, 1)},
+                'branches': names, 'files': {}})
+        self.project_ids = {project['id']: project for project in self.projects}
+        # Only reachable through includes, it is not part of the organization tree
+        self.project_ids[TEMPLATE_PROJECT] = {
+            'id': len(self.projects) + 1, 'name': 'ci-templates', 'path': 'ci-templates', 'group': self.groups[0]['id'],
+            'variant': 0, 'path_with_namespace': TEMPLATE_PROJECT, 'last_activity_at': "2020-01-01T00:00:00.000Z",
+            'languages': {}, 'branches': ['main', 'v1', 'v2', 'v3'],
+            'files': {branch: {TEMPLATE_FILE.lstrip('/'): self.template} for branch in ['main', 'v1', 'v2', 'v3']}}
+
+    def web_url(self, base, path):
+        return "{}/{}".format(base, path)
+
+    def group_json(self, base, group):
+        return {'id': group['id'], 'name': group['name'], 'path': group['path'], 'full_path': group['full_path'],
+                'parent_id': group['parent_id'], 'web_url': self.web_url(base, group['full_path'])}
+
+    def project_json(self, base, project):
+        group = self.group_ids[project['group']]
+        if self.repos:
+            url = "file://{}".format(os.path.join(self.repos, "variant-{}.git".format(project['variant'])))
+        else:
+            url = self.web_url(base, project['path_with_namespace'] + '.git')
+        return {'id': project['id'], 'name': project['name'], 'path': project['path'],
+                'path_with_namespace': project['path_with_namespace'], 'http_url_to_repo': url,
+                'ssh_url_to_repo': url, 'web_url': self.web_url(base, project['path_with_namespace']),
+                'last_activity_at': project['last_activity_at'], 'default_branch': 'main',
+                'namespace': {'id': group['id'], 'full_path': group['full_path'], 'kind': 'group'}}
+
+    def file_text(self, project, path, ref):
+        # Files pushed to a branch shadow the CI variant of the project, on that branch only
+        if ref not in project['branches']:
+            return None
+        files = project['files'].get(ref, {})
+        if path in files:
+            return files[path]
+        if path == '.gitlab-ci.yml':
+            return self.variants[project['variant']]
+        return None
+
+    def make_repos(self, path):
+        # One bare repository per CI variant, every project clones one of them
+        os.makedirs(path, exist_ok=True)
+        self.repos = path
+        env = dict(os.environ, GIT_AUTHOR_NAME='bench', GIT_AUTHOR_EMAIL='bench@localhost',
+                   GIT_COMMITTER_NAME='bench', GIT_COMMITTER_EMAIL='bench@localhost')
+        for index, text in enumerate(self.variants):
+            bare = os.path.join(path, "variant-{}.git".format(index))
+            if os.path.exists(bare):
+                continue
+            with tempfile.TemporaryDirectory() as work:
+                subprocess.run(['git', 'init', '-q', '-b', 'main', work], check=True, env=env)
+                with open(os.path.join(work, '.gitlab-ci.yml'), 'w') as stream:
+                    stream.write(text)
+                with open(os.path.join(work, 'Main.java'), 'w') as stream:
+                    stream.write("class Main {}\n" * (index + 1))
+                subprocess.run(['git', '-C', work, 'add', '.'], check=True, env=env)
+                subprocess.run(['git', '-C', work, 'commit', '-q', '-m', 'init'], check=True, env=env)
+                subprocess.run(['git', 'clone', '-q', '--bare', work, bare], check=True, env=env)
+
+
+class Limiter:
+    def __init__(self, per_second):
+        self.per_second = per_second
+        self.served = deque()
+        self.lock = threading.Lock()
+
+    def check(self):
+        # Sliding window of one second, returns the headers gitlab sends and whether to refuse
+        if not self.per_second:
+            return {}, False
+        now = time.time()
+        with self.lock:
+            while self.served and self.served[0] <= now - 1.0:
+                self.served.popleft()
+            refused = len(self.served) >= self.per_second
+            if not refused:
+                self.served.append(now)
+            remaining = self.per_second - len(self.served)
+            reset = (self.served[0] if self.served else now) + 1.0
+        headers = {'RateLimit-Limit': str(self.per_second), 'RateLimit-Remaining': str(max(remaining, 0)),
+                   'RateLimit-Reset': str(int(reset) + 1)}
+        if refused:
+            headers['Retry-After'] = '1'
+        return headers, refused
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.routes = Counter()
+        self.throttled = 0
+        self.total = 0
+
+    def count(self, route, throttled=False):
+        with self.lock:
+            self.total += 1
+            self.routes[route] += 1
+            self.throttled += throttled
+
+    def json(self):
+        with self.lock:
+            return {'total': self.total, 'throttled': self.throttled, 'routes': dict(self.routes)}
+
+
+ROUTES = [
+    ('GET', re.compile(r'^/groups$'), 'groups'),
+    ('GET', re.compile(r'^/groups/(\d+)/subgroups$'), 'subgroups'),
+    ('GET', re.compile(r'^/groups/(\d+)/projects$'), 'group_projects'),
+    ('GET', re.compile(r'^/projects$'), 'projects'),
+    ('GET', re.compile(r'^/projects/([^/]+)$'), 'project'),
+    ('GET', re.compile(r'^/projects/([^/]+)/languages$'), 'languages'),
+    ('GET', re.compile(r'^/projects/([^/]+)/repository/files/([^/]+)$'), 'file'),
+    ('HEAD', re.compile(r'^/projects/([^/]+)/repository/files/([^/]+)$'), 'file'),
+    ('GET', re.compile(r'^/projects/([^/]+)/repository/branches$'), 'branches'),
+    ('GET', re.compile(r'^/projects/([^/]+)/repository/branches/(.+)$'), 'branch'),
+    ('POST', re.compile(r'^/projects/([^/]+)/repository/branches$'), 'create_branch'),
+    ('DELETE', re.compile(r'^/projects/([^/]+)/repository/branches/(.+)$'), 'delete_branch'),
+    ('POST', re.compile(r'^/projects/([^/]+)/repository/commits$'), 'commit'),
+    ('GET', re.compile(r'^/templates/gitlab_ci_ymls/(.+)$'), 'template'),
+]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Small responses on kept alive connections would otherwise wait for delayed acks
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_HEAD(self):
+        self.dispatch('HEAD')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length) if length else b''
+        if not data:
+            return {}
+        if 'json' in (self.headers.get('Content-Type') or ''):
+            return json.loads(data.decode('utf-8'))
+        return {key: values[-1] for key, values in parse_qs(data.decode('utf-8')).items()}
+
+    def send(self, status, data=None, headers=None):
+        payload = b'' if data is None else json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(payload)
+
+    def dispatch(self, method):
+        server = self.server
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path == '/_stats':
+            return self.send(200, server.stats.json())
+        if url.path == '/_reset':
+            server.stats.reset()
+            return self.send(200, {})
+        if url.path == GRAPHQL and method == 'POST':
+            name, groups = 'graphql', ()
+        elif url.path.startswith(API):
+            path = url.path[len(API):]
+            for route_method, pattern, name in ROUTES:
+                match = pattern.match(path)
+                if route_method == method and match:
+                    groups = match.groups()
+                    break
+            else:
+                server.stats.count('unknown')
+                return self.send(404, {'message': '404 Not Found'})
+        else:
+            return self.send(404, {'message': '404 Not Found'})
+        headers, refused = server.limiter.check()
+        server.stats.count(name, refused)
+        if server.latency:
+            time.sleep(server.latency)
+        if refused:
+            return self.send(429, {'message': 'Retry later'}, headers)
+        status, data, extra = getattr(self, 'route_' + name)(query, *[unquote(group) for group in groups])
+        headers.update(extra or {})
+        self.send(status, data, headers)
+
+    def base(self):
+        return "http://{}".format(self.headers.get('Host'))
+
+    def page(self, items, query):
+        # Offset pagination with the headers python-gitlab reads
+        per_page = min(int(query.get('per_page', 20)), 100)
+        page = max(int(query.get('page', 1)), 1)
+        total = len(items)
+        pages = max((total + per_page - 1) // per_page, 1)
+        headers = {'X-Total': str(total), 'X-Total-Pages': str(pages), 'X-Per-Page': str(per_page),
+                   'X-Page': str(page), 'X-Next-Page': str(page + 1) if page < pages else ''}
+        if page < pages:
+            params = dict(query, page=page + 1, per_page=per_page)
+            link = "{}{}?{}".format(self.base(), urlsplit(self.path).path,
+                                    "&".join("{}={}".format(k, v) for k, v in params.items()))
+            headers['Link'] = '<{}>; rel="next"'.format(link)
+        return 200, items[(page - 1) * per_page:page * per_page], headers
+
+    def project(self, id):
+        # Projects are asked for by id or by their url encoded full path
+        return self.server.org.project_ids.get(int(id) if id.isdigit() else id)
+
+    def route_groups(self, query):
+        org = self.server.org
+        return self.page([org.group_json(self.base(), group) for group in org.groups], query)
+
+    def route_subgroups(self, query, id):
+        org = self.server.org
+        return self.page([org.group_json(self.base(), group) for group in org.groups
+                          if group['parent_id'] == int(id)], query)
+
+    def route_group_projects(self, query, id):
+        org = self.server.org
+        return self.page([org.project_json(self.base(), project) for project in org.projects
+                          if project['group'] == int(id)], query)
+
+    def route_projects(self, query):
+        org = self.server.org
+        after = query.get('last_activity_after')
+        projects = [project for project in org.projects if after is None or project['last_activity_at'] > after]
+        return self.page([org.project_json(self.base(), project) for project in projects], query)
+
+    def route_project(self, query, id):
+        project = self.project(id)
+        if project is None:
+            return 404, {'message': '404 Project Not Found'}, None
+        return 200, self.server.org.project_json(self.base(), project), None
+
+    def route_languages(self, query, id):
+        project = self.project(id)
+        if project is None:
+            return 404, {'message': '404 Project Not Found'}, None
+        return 200, project['languages'], None
+
+    def route_file(self, query, id, path):
+        project = self.project(id)
+        text = None if project is None else self.server.org.file_text(project, path, query.get('ref', 'main'))
+        if text is None:
+            return 404, {'message': '404 File Not Found'}, None
+        sha = blob_sha(text)
+        return 200, {'file_name': os.path.basename(path), 'file_path': path, 'size': len(text),
+                     'encoding': 'base64', 'content': base64.b64encode(text.encode('utf-8')).decode('ascii'),
+                     'ref': query.get('ref', 'main'), 'blob_id': sha, 'commit_id': sha,
+                     'last_commit_id': sha}, {'X-Gitlab-Blob-Id': sha}
+
+    def branch_json(self, name):
+        return {'name': name, 'merged': False, 'protected': name == 'main', 'default': name == 'main',
+                'commit': {'id': blob_sha(name)}}
+
+    def route_branches(self, query, id):
+        project = self.project(id)
+        if project is None:
+            return 404, {'message': '404 Project Not Found'}, None
+        search = query.get('search')
+        names = project['branches']
+        if search:
+            if search.startswith('^'):
+                names = [name for name in names if name.startswith(search[1:])]
+            elif search.endswith('$'):
+                names = [name for name in names if name.endswith(search[:-1])]
+            else:
+                names = [name for name in names if search in name]
+        return self.page([self.branch_json(name) for name in names], query)
+
+    def route_branch(self, query, id, name):
+        project = self.project(id)
+        if project is None or name not in project['branches']:
+            return 404, {'message': '404 Branch Not Found'}, None
+        return 200, self.branch_json(name), None
+
+    def route_create_branch(self, query, id):
+        project = self.project(id)
+        data = dict(query, **self.body())
+        with self.server.org.lock:
+            if project is None or data.get('ref') not in project['branches']:
+                return 400, {'message': 'Invalid reference name'}, None
+            if data['branch'] in project['branches']:
+                return 400, {'message': 'Branch already exists'}, None
+            project['branches'].append(data['branch'])
+            project['files'][data['branch']] = dict(project['files'].get(data['ref'], {}))
+        return 201, self.branch_json(data['branch']), None
+
+    def route_delete_branch(self, query, id, name):
+        project = self.project(id)
+        with self.server.org.lock:
+            if project is None or name not in project['branches']:
+                return 404, {'message': '404 Branch Not Found'}, None
+            project['branches'].remove(name)
+            project['files'].pop(name, None)
+        return 204, None, None
+
+    def route_commit(self, query, id):
+        project = self.project(id)
+        data = self.body()
+        with self.server.org.lock:
+            if project is None:
+                return 404, {'message': '404 Project Not Found'}, None
+            branch, start = data['branch'], data.get('start_branch')
+            if start is not None:
+                if branch in project['branches']:
+                    return 400, {'message': 'A branch called {} already exists'.format(branch)}, None
+                if start not in project['branches']:
+                    return 400, {'message': 'Invalid start branch'}, None
+                project['branches'].append(branch)
+                project['files'][branch] = dict(project['files'].get(start, {}))
+            elif branch not in project['branches']:
+                return 400, {'message': 'You can only create or edit files when you are on a branch'}, None
+            files = project['files'].setdefault(branch, {})
+            for action in data.get('actions', []):
+                files[action['file_path']] = action.get('content', '')
+        return 201, {'id': blob_sha(json.dumps(data, sort_keys=True)), 'title': data.get('commit_message')}, None
+
+    def route_template(self, query, name):
+        content = TEMPLATES.get(name)
+        if content is None:
+            return 404, {'message': '404 Template Not Found'}, None
+        return 200, {'name': name, 'content': content}, None
+
+
+    def graphql_project(self, project, query, variables):
+        # Only the fields of the queries revisor sends
+        node = {'id': "gid://gitlab/Project/{}".format(project['id'])}
+        if 'languages' in query:
+            node['languages'] = [{'name': name, 'share': share} for name, share in project['languages'].items()]
+        if 'blobs(' in query:
+            blobs = []
+            for path in variables['paths']:
+                text = self.server.org.file_text(project, path, variables['ref'])
+                if text is not None:
+                    blobs.append({'path': path, 'oid': blob_sha(text), 'rawBlob': text})
+            node['repository'] = {'blobs': {'nodes': blobs}}
+        if 'branchNames' in query:
+            names = [name for name in project['branches'] if fnmatchcase(name, variables['pattern'])]
+            node['repository'] = {'branchNames': names[:variables['limit']]}
+        return node
+
+    def route_graphql(self, query):
+        request = self.body()
+        variables = request.get('variables') or {}
+        ids = [int(id.rsplit('/', 1)[-1]) for id in variables.get('ids') or []]
+        projects = [self.server.org.project_ids[id] for id in ids if id in self.server.org.project_ids]
+        nodes = [self.graphql_project(project, request.get('query', ''), variables)
+                 for project in projects[:min(variables.get('first') or 100, GRAPHQL_PAGE)]]
+        return 200, {'data': {'projects': {'nodes': nodes}}}, None
+
+
+class FakeGitlab(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, org, port=0, latency=0.0, rate_limit=0):
+        super().__init__(('127.0.0.1', port), Handler)
+        self.org = org
+        self.latency = latency
+        self.limiter = Limiter(rate_limit)
+        self.stats = Stats()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name='fake-gitlab', daemon=True)
+        thread.start()
+        return self
+
+
+def organization(arguments):
+    org = Organization(groups=int(arguments["--groups"]), depth=int(arguments["--depth"]),
+                       projects=int(arguments["--projects"]), variants=int(arguments["--variants"]),
+                       branches=int(arguments["--branches"]), seed=int(arguments["--seed"]))
+    if arguments["--repos"]:
+        org.make_repos(arguments["--repos"])
+    return org
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    server = FakeGitlab(organization(arguments), port=int(arguments["--port"]),
+                        latency=float(arguments["--latency"]) / 1000.0, rate_limit=int(arguments["--rate-limit"]))
+    # The harness reads the url from the first line
+    print(server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    sys.exit(0)
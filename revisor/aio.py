@@ -0,0 +1,163 @@
+from urllib.parse import quote
+import aiohttp
+import asyncio
+import base64
+import random
+import logging
+import json
+import sys
+import time
+import git
+
+log = logging.getLogger(__name__)
+
+RETRY_STATUS = (500, 502, 503, 504)
+IDEMPOTENT = ('GET', 'HEAD', 'PUT', 'DELETE')
+
+
+def decode(file_object):
+    return base64.b64decode(file_object['content']).decode('utf-8')
+
+
+async def off_loop(function, *args):
+    # Printing, the result sink, YAML parsing and python-gitlab block, they run in the default executor
+    return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+class AsyncGitlab:
+    def __init__(self, url, token, session, scheduler, retries=3, backoff=0.5):
+        self.api = "{}/api/v4".format(url.rstrip('/'))
+        self.headers = {'PRIVATE-TOKEN': token}
+        self.session = session
+        self.scheduler = scheduler
+        self.retries = retries
+        self.backoff = backoff
+
+    async def request(self, method, path, params=None):
+        for attempt in range(self.retries + 1):
+            await asyncio.sleep(max(self.scheduler.reserve(), 0))
+            try:
+                async with self.session.request(method, self.api + path, params=params,
+                                                headers=self.headers) as response:
+                    self.scheduler.observe(response.status, response.headers)
+                    body = await response.text()
+                    if response.status < 400:
+                        return (json.loads(body) if body else None), response.headers
+                    # The scheduler already paused every worker for a 429
+                    if response.status == 429 and attempt < self.retries:
+                        continue
+                    if response.status not in RETRY_STATUS or method not in IDEMPOTENT or attempt == self.retries:
+                        response.raise_for_status()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if method not in IDEMPOTENT or attempt == self.retries:
+                    raise
+            await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    async def get(self, path, **params):
+        data, _ = await self.request('GET', path, params=params)
+        return data
+
+    async def pages(self, path, **params):
+        page = 1
+        while page:
+            data, headers = await self.request('GET', path, params=dict(params, per_page=100, page=page))
+            for item in data:
+                yield item
+            page = headers.get('X-Next-Page')
+
+    async def file(self, id, file_name, ref):
+        return await self.get("/projects/{id}/repository/files/{path}".format(
+            id=id, path=quote(file_name, safe='')), ref=ref)
+
+    async def ci_file(self, action):
+        try:
+            return await self.file(action.node.id, git.CI_FILE, action.arguments["--name"])
+        except aiohttp.ClientResponseError as e:
+            start = git.start_ref(action.arguments)
+            if e.status != 404 or start is None:
+                raise
+        action.start_branch = start
+        return await self.file(action.node.id, git.CI_FILE, start)
+
+    async def languages(self, id):
+        return await self.get("/projects/{}/languages".format(id))
+
+    async def branches(self, id, search=None):
+        params = {} if search is None else {'search': search}
+        return [branch['name'] async for branch in self.pages("/projects/{}/repository/branches".format(id), **params)]
+
+
+async def plugins_action(gitlab, action):
+    action.started = time.monotonic()
+    cache = action.arguments["lang_cache"]
+    lang_dict = cache.get(action.node)
+    try:
+        if lang_dict is None:
+            file_object, lang_dict = await asyncio.gather(gitlab.ci_file(action), gitlab.languages(action.node.id))
+            cache.put(action.node, lang_dict)
+        else:
+            file_object = await gitlab.ci_file(action)
+    except aiohttp.ClientResponseError as e:
+        if e.status != 404:
+            raise
+        await off_loop(git.report_missing, action, action.arguments["--name"])
+        return
+    text = lambda: decode(file_object)
+    lang = await off_loop(plugins_lang, action, lang_dict, file_object['blob_id'], text)
+    await off_loop(git.report_plugins, action, action.node.name, lang, file_object['blob_id'], text)
+
+
+def plugins_lang(action, lang_dict, blob_id, text):
+    # Parses the file and may read the disk cache, so it runs off the loop
+    yaml_data = action.arguments["blob_cache"].document(blob_id, text)
+    try:
+        return git.lang_from(lang_dict, yaml_data)
+    except:
+        log.info(sys.exc_info())
+        return None
+
+
+def report_branches(action, branches):
+    found = git.print_branches(action.node.name, branches, True)
+    status = git.branch_status(action.arguments, found)
+    git.record_result(action, action.node.name, None, 'branch', status)
+    git.finish(action, status)
+
+
+def report_error(action, step, error):
+    log.info("Error in project {path}: {error}".format(path=action.path, error=error))
+    git.record_result(action, action.node.name, None, step, 'error')
+    git.finish(action, 'error')
+
+
+async def security_branch(gitlab, action):
+    # --create and --remove are planned by branchplan, the async engine only lists
+    await off_loop(report_branches, action, await gitlab.branches(action.node.id, action.arguments["--search"]))
+
+
+async def run(actions, action, arguments):
+    in_flight = int(arguments["--in-flight"])
+    handler = plugins_action if action == 'plugins' else security_branch
+    connector = aiohttp.TCPConnector(limit=in_flight)
+    timeout = aiohttp.ClientTimeout(total=float(arguments["--timeout"]))
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        gitlab = AsyncGitlab(arguments["url_base"], arguments["token"], session, arguments["scheduler"],
+                             retries=int(arguments["--retries"]), backoff=float(arguments["--backoff"]))
+        actions = iter(actions)
+
+        async def worker():
+            # Workers share one iterator, so only in_flight actions exist at a time
+            for git_action in actions:
+                if not git.is_gitlab_project(git_action.node):
+                    continue
+                try:
+                    await handler(gitlab, git_action)
+                except Exception as e:
+                    await off_loop(report_error, git_action, action, e)
+                git.progress.show_progress(git_action.node.name, action)
+
+        await asyncio.gather(*(worker() for _ in range(in_flight)))
+
+
+def sync_action_async(actions, action, arguments):
+    asyncio.run(run(actions, action, arguments))
@@ -0,0 +1,104 @@
+from collections import OrderedDict
+from urllib.parse import quote
+import threading
+import logging
+import pickle
+import copy
+import yaml
+import os
+
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
+log = logging.getLogger(__name__)
+
+
+def load_yaml(text):
+    return yaml.load(text, Loader=SafeLoader)
+
+
+def dump_yaml(data):
+    return yaml.dump(data, Dumper=SafeDumper, default_flow_style=False, sort_keys=False)
+
+
+class BlobCache:
+    def __init__(self, size=1024, path=None):
+        self.size = size
+        self.path = path
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if path and not os.path.exists(path):
+            os.makedirs(path)
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+        value = self.read(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is not None:
+            self.remember(key, value)
+        return value
+
+    def put(self, key, value):
+        self.remember(key, value)
+        self.write(key, value)
+        return value
+
+    def remember(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def file_name(self, key):
+        return os.path.join(self.path, quote("-".join(str(part) for part in key), safe='') + ".pickle")
+
+    def read(self, key):
+        if not self.path:
+            return None
+        try:
+            with open(self.file_name(key), 'rb') as stream:
+                return pickle.load(stream)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            log.debug("Discarding unreadable cache entry {}".format(key), exc_info=True)
+            return None
+
+    def write(self, key, value):
+        if not self.path:
+            return
+        name = self.file_name(key)
+        tmp = "{}.{}.tmp".format(name, threading.get_ident())
+        with open(tmp, 'wb') as stream:
+            pickle.dump(value, stream, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, name)
+
+    def document(self, sha, text):
+        # text is only called on a miss, so a hit skips the decode and the parse
+        key = ('doc', sha)
+        document = self.get(key)
+        if document is None:
+            document = self.put(key, load_yaml(text()))
+        return document
+
+    def dump(self, sha, lang, text, transform):
+        key = ('dump', sha, lang)
+        dump_file = self.get(key)
+        if dump_file is None:
+            # The transform mutates the document, the cached one stays pristine
+            document = copy.deepcopy(self.document(sha, text))
+            dump_file = self.put(key, dump_yaml(transform(document)))
+        return dump_file
@@ -0,0 +1,106 @@
+import concurrent.futures
+import logging
+import git
+import graphql
+import pipeline
+from gitlab import GitlabGetError
+
+log = logging.getLogger(__name__)
+
+
+class Step:
+    def __init__(self, operation, action):
+        self.operation = operation
+        self.action = action
+        self.path = action.path
+        self.node = action.node
+        self.arguments = action.arguments
+
+
+def project_of(action):
+    # Lazy handle, building the URL of the branches endpoint needs no request
+    return action.arguments["gitlab"].projects.get(action.node.id, lazy=True)
+
+
+def branch_exists(action):
+    try:
+        project_of(action).branches.get(action.arguments["--name"])
+        return True
+    except GitlabGetError as e:
+        if e.response_code == 404:
+            return False
+        raise
+
+
+def operation(arguments, exists):
+    if arguments["--create"] and not exists:
+        return 'create'
+    if arguments["--remove"] and exists:
+        return 'delete'
+    return None
+
+
+def plan_rest(actions, arguments):
+    workers = int(arguments["--concurrency"])
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        yield from pipeline.bounded(actions, lambda action: executor.submit(branch_exists, action), 2 * workers)
+
+
+def plan_graphql(actions, arguments):
+    # One query answers for a whole batch of projects
+    client = graphql.make_client(arguments)
+    name = arguments["--name"]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=int(arguments["--concurrency"])) as executor:
+        submit = lambda batch: executor.submit(client.branches_batch, [action.node.id for action in batch], name)
+        for batch, branches, error in pipeline.bounded(graphql.batches(actions, int(arguments["--batch"])), submit,
+                                                       int(arguments["--concurrency"])):
+            for action in batch:
+                yield action, None if error else name in branches.get(action.node.id, ()), error
+
+
+def make_plan(actions, arguments):
+    projects = (action for action in actions if git.is_gitlab_project(action.node))
+    checks = plan_graphql(projects, arguments) if arguments["--graphql"] else plan_rest(projects, arguments)
+    plan = []
+    for action, exists, error in checks:
+        git.progress.show_progress(action.node.name, 'plan')
+        if error is not None:
+            pipeline.report_error(action, 'plan', error)
+            continue
+        step = operation(arguments, exists)
+        git.record_result(action, action.node.name, None, 'plan', step or 'skip')
+        if step is not None:
+            plan.append(Step(step, action))
+        else:
+            git.finish(action, 'skip')
+    return plan
+
+
+def print_plan(plan, arguments):
+    print("plan: {name}".format(name=arguments["--name"]))
+    for step in plan:
+        print("- {operation} {path}".format(operation=step.operation, path=step.path))
+    print("---")
+
+
+def run_step(step):
+    project = project_of(step.action)
+    branch = step.arguments["--name"]
+    if step.operation == 'create':
+        git.check_ref_branch(step.action, project, step.arguments["--ref"])
+        ok = git.create_branch(project, branch, step.arguments["--ref"])
+    else:
+        ok = git.delete_branch(project, branch)
+    git.record_result(step.action, step.node.name, None, step.operation, 'ok' if ok else 'error')
+    return ok
+
+
+def sync_branches(actions, arguments):
+    # Every check first, then only the projects that need a change are touched
+    plan = make_plan(actions, arguments)
+    log.debug("Branch plan with [{creates}] creates and [{deletes}] deletes".format(
+        creates=sum(step.operation == 'create' for step in plan),
+        deletes=sum(step.operation == 'delete' for step in plan)))
+    print_plan(plan, arguments)
+    for name in ('create', 'delete'):
+        pipeline.sync_threads([step for step in plan if step.operation == name], run_step, arguments, name)
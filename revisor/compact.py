@@ -0,0 +1,206 @@
+from array import array
+import sys
+
+
+class CompactTree:
+    def __init__(self, url):
+        # Column per attribute, a node is just its index, index 0 is the root
+        self.parents = array('i', [-1])
+        self.first_child = array('i', [-1])
+        self.last_child = array('i', [-1])
+        self.next_sibling = array('i', [-1])
+        self.ids = array('q', [-1])
+        self.names = [""]
+        self.urls = [url]
+        self.activity = [None]
+        self.version = 0
+        self.counts = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, parent, url, id=-1, last_activity_at=None):
+        index = len(self.names)
+        for column in (self.parents, self.first_child, self.last_child, self.next_sibling):
+            column.append(-1)
+        self.ids.append(id)
+        # Group and project names repeat a lot across an instance
+        self.names.append(sys.intern(str(name)))
+        self.urls.append(url)
+        self.activity.append(last_activity_at)
+        self.link(index, parent)
+        return index
+
+    def link(self, index, parent):
+        self.parents[index] = parent
+        self.next_sibling[index] = -1
+        if parent >= 0:
+            if self.last_child[parent] < 0:
+                self.first_child[parent] = index
+            else:
+                self.next_sibling[self.last_child[parent]] = index
+            self.last_child[parent] = index
+        self.version += 1
+
+    def unlink(self, index):
+        parent = self.parents[index]
+        if parent < 0:
+            return
+        previous, child = -1, self.first_child[parent]
+        while child != index:
+            previous, child = child, self.next_sibling[child]
+        if previous < 0:
+            self.first_child[parent] = self.next_sibling[index]
+        else:
+            self.next_sibling[previous] = self.next_sibling[index]
+        if self.last_child[parent] == index:
+            self.last_child[parent] = previous
+        self.parents[index] = -1
+        self.next_sibling[index] = -1
+        self.version += 1
+
+    def children(self, index):
+        child = self.first_child[index]
+        while child >= 0:
+            yield child
+            child = self.next_sibling[child]
+
+    def path(self, index):
+        path = []
+        while index >= 0:
+            path.append(index)
+            index = self.parents[index]
+        path.reverse()
+        return path
+
+    def root_of(self, index):
+        while self.parents[index] >= 0:
+            index = self.parents[index]
+        return index
+
+    def root_path(self, index):
+        return "/".join(self.names[i] for i in self.path(index))
+
+    def walk(self, index):
+        stack = [index]
+        while stack:
+            index = stack.pop()
+            yield index
+            stack.extend(reversed(list(self.children(index))))
+
+    def count(self):
+        # Leaves and descendants of the root, recomputed only after the tree changed
+        if self.counts is None or self.counts[0] != self.version:
+            leaves = descendants = 0
+            for index in self.walk(0):
+                if index == 0:
+                    continue
+                descendants += 1
+                if self.first_child[index] < 0:
+                    leaves += 1
+            self.counts = (self.version, leaves, descendants)
+        return self.counts[1], self.counts[2]
+
+    def set(self, index, key, value):
+        # root_path is derived from the names, anything else has no column
+        if key == 'name':
+            self.names[index] = sys.intern(str(value))
+        elif key == 'url':
+            self.urls[index] = value
+        elif key == 'id':
+            self.ids[index] = value
+        elif key == 'last_activity_at':
+            self.activity[index] = value
+
+
+class CompactNode:
+    # anytree compatible view over one index of a CompactTree
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, CompactNode) and other.tree is self.tree and other.index == self.index
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self.tree), self.index))
+
+    def __repr__(self):
+        return "CompactNode('{}')".format(self.root_path)
+
+    def view(self, index):
+        return CompactNode(self.tree, index)
+
+    @property
+    def name(self):
+        return self.tree.names[self.index]
+
+    @property
+    def id(self):
+        return self.tree.ids[self.index]
+
+    @property
+    def url(self):
+        return self.tree.urls[self.index]
+
+    @property
+    def last_activity_at(self):
+        return self.tree.activity[self.index]
+
+    @property
+    def root_path(self):
+        return self.tree.root_path(self.index)
+
+    @property
+    def parent(self):
+        parent = self.tree.parents[self.index]
+        return None if parent < 0 else self.view(parent)
+
+    @parent.setter
+    def parent(self, parent):
+        self.tree.unlink(self.index)
+        if parent is not None:
+            self.tree.link(self.index, parent.index)
+
+    @property
+    def children(self):
+        return tuple(self.view(child) for child in self.tree.children(self.index))
+
+    @property
+    def is_leaf(self):
+        return self.tree.first_child[self.index] < 0
+
+    @property
+    def is_root(self):
+        return self.tree.parents[self.index] < 0
+
+    @property
+    def path(self):
+        return tuple(self.view(index) for index in self.tree.path(self.index))
+
+    @property
+    def root(self):
+        return self.view(self.tree.root_of(self.index))
+
+    @property
+    def depth(self):
+        return len(self.tree.path(self.index)) - 1
+
+    @property
+    def descendants(self):
+        return tuple(self.view(index) for index in self.tree.walk(self.index) if index != self.index)
+
+    @property
+    def leaves(self):
+        return tuple(self.view(index) for index in self.tree.walk(self.index)
+                     if self.tree.first_child[index] < 0)
+
+    @property
+    def height(self):
+        children = self.children
+        return max(child.height for child in children) + 1 if children else 0
@@ -2,21 +2,37 @@ import logging
 import os
 import sys
 import subprocess
-import git
 import yaml
 import time
 import csv
 import random
+import hashlib
+import json
 import requests
-from gitlab import Gitlab, GitlabError, GitlabAuthenticationError
+from gitlab import Gitlab, GitlabError, GitlabGetError, GitlabAuthenticationError
 from progress import ProgressBar
 import concurrent.futures
+import aio
+import graphql
+import offline
+import pipeline
+import branchplan
+import index
+from blobcache import load_yaml
+from includes import key_name
+from manifest import Manifest
+from gitproc import GitRunner
+from sink import ResultSink
+from journal import Journal
+from transport import list_all
+import shutil
 
 log = logging.getLogger(__name__)
 
 progress = ProgressBar('* syncing projects')
 emo = ["\U0001F331",'\U0001F332', '\U0001F333', '\U0001F334', '\U0001F335','\U0001F33E', '\U0001F33F', '\U0001F340', '\U0001F341']
-gitlab_keywords = ["image", "services", "stages", "types", "before_script", "after_script", "variables", "cache", "include" ]
+CI_FILE = '.gitlab-ci.yml'
+gitlab_keywords = ["image", "services", "stages", "types", "before_script", "after_script", "variables", "cache", "include", "default", "workflow" ]
 class GitAction:
     def __init__(self, node, path, arguments):
         self.node = node
@@ -24,106 +40,169 @@ class GitAction:
         self.arguments = arguments
 
 
-def sync_action(root, action, arguments, disable_progress=False):
+def sync_action(root, action, arguments, disable_progress=False, total=None):
+    shard = arguments.get("shard")
+    if shard is not None:
+        total = sum(1 for leaf in root.leaves if shard.owns(leaf))
+        log.debug("Shard {index}/{total} owns [{num}] projects".format(index=shard.index, total=shard.total, num=total))
     if not disable_progress:
-        progress.init_progress(len(root.leaves))
-    actions = get_git_actions(root, arguments["<path>"], arguments)
-    with concurrent.futures.ThreadPoolExecutor(max_workers=int(arguments["--concurrency"])) as executor:
-        if action == 'plugins':
-            executor.map(plugins_action, actions)
-        if action == 'branch':
-            executor.map(security_branch, actions)
-        if action == 'clone':
-            executor.map(clone_or_pull_project, actions)
-        else:
-            executor.map(PRINT, actions)
+        progress.init_progress(len(root.leaves) if total is None else total)
+    actions = get_git_actions(root, arguments["<path>"], arguments, make_dirs=(action == 'clone'))
+    if shard is not None:
+        actions = shard.select(actions)
+    if arguments["--journal"] is not None:
+        arguments["journal"] = Journal(shard_path(arguments["--journal"], shard), action, arguments,
+                                       resume=arguments["--resume"])
+        actions = arguments["journal"].pending(actions, progress)
+    if arguments["--output"] is not None:
+        arguments["sink"] = ResultSink(shard_path(arguments["--output"], shard), arguments["--output-format"]).start()
+    if arguments["--lang-refresh"] and action == 'plugins' and not arguments["--offline"]:
+        projects = get_git_actions(root, arguments["<path>"], arguments)
+        graphql.refresh_languages(projects if shard is None else shard.select(projects), arguments)
+    try:
+        run_actions(actions, action, arguments)
+    finally:
+        if arguments.get("sink") is not None:
+            arguments["sink"].close()
+        if arguments.get("journal") is not None:
+            arguments["journal"].close()
+        arguments["lang_cache"].save()
 
     elapsed = progress.finish_progress()
     log.debug("Syncing projects took [{}]".format(elapsed))
 
-def PRINT():
-    print("To do")
-
-def get_git_actions(root, dest, arguments):
-    actions = []
+def shard_path(path, shard):
+    # Every shard writes its own files, merge puts them back together
+    return path if shard is None else shard.path(path)
+
+def run_actions(actions, action, arguments):
+    if arguments["--offline"] and action == 'plugins':
+        offline.sync_plugins_offline(actions, arguments)
+    elif arguments["--graphql"] and action == 'plugins':
+        graphql.sync_plugins_graphql(actions, arguments)
+    elif arguments["--engine"] == "async" and (action == 'plugins' or (action == 'branch' and arguments["--list"])):
+        aio.sync_action_async(actions, action, arguments)
+    elif action == 'plugins':
+        pipeline.sync_plugins(actions, arguments)
+    elif action == 'branch' and not arguments["--list"]:
+        branchplan.sync_branches(actions, arguments)
+    elif action == 'branch':
+        pipeline.sync_threads(actions, security_branch, arguments, 'branch')
+    elif action == 'index':
+        index.sync_index(actions, arguments)
+    elif action == 'clone':
+        arguments["git_runner"] = GitRunner(int(arguments["--git-concurrency"]),
+                                            timeout=float(arguments["--git-timeout"]),
+                                            retries=int(arguments["--git-retries"]))
+        arguments["manifest"] = Manifest(arguments["<path>"], arguments["git_runner"])
+        # git processes are limited by their own slots, not by the API workers
+        workers = max(int(arguments["--concurrency"]), int(arguments["--git-concurrency"]))
+        try:
+            pipeline.sync_threads(actions, clone_or_pull_project, arguments, 'clone',
+                                  interrupt=arguments["git_runner"].terminate, workers=workers)
+            # Only a full run tells which projects left the tree
+            arguments["manifest"].report()
+        finally:
+            # An interrupted run keeps what it synced so far
+            arguments["manifest"].save()
+            arguments["git_runner"].report(arguments["--git-report"])
+
+def get_git_actions(root, dest, arguments, make_dirs=False):
+    # Lazy, only the clone action needs the directories on disk
     for child in root.children:
-        path = "{0}{1}".format(dest, child.root_path)
-        if not os.path.exists(path):
+        path = "{0}{1}".format(dest or "", child.root_path)
+        if make_dirs and not os.path.exists(path):
             os.makedirs(path)
         if child.is_leaf:
-            actions.append(GitAction(child, path, arguments))
-        if not child.is_leaf:
-            actions.extend(get_git_actions(child, dest, arguments))
-    return actions
+            yield GitAction(child, path, arguments)
+        else:
+            yield from get_git_actions(child, dest, arguments, make_dirs)
 
 def is_git_repo(path):
-    try:
-        x = git.Repo(path).git_dir
-        return True
-    except git.InvalidGitRepositoryError:
-        return False
-    except Exception as e:
-        log.info(e)
-        log.info(sys.exc_info())    
+    return os.path.isdir(os.path.join(path, '.git'))
 
 def is_gitlab_project(node):
     return True if node.id > 0 else False
 
-def plugins_action(action):
-    if is_gitlab_project(action.node):
-        gitlab = action.arguments["gitlab"]
-        project = get_project(gitlab, action.node.id)
-        branch = action.arguments["--name"]
-        yaml_data = get_yaml(project, '.gitlab-ci.yml', branch)
-        lang = get_lang(project, yaml_data)
-        # print(lang)
-        yaml_data = add_veracode(yaml_data, lang)
-        dump_file=yaml.safe_dump(yaml_data, default_flow_style=False, sort_keys=False)
-        try:
-            print("project:\n- url: {url} \n- name: {name}\n- lang: \U0001F419 {lang}\n---".format(url = action.node.url, name=action.node.name, lang=lang))
-        except:
-            log.info(sys.exc_info())
-
-        if(action.arguments["--output"] != None):
-            log.debug("dumping to csv")
-            dump_to_csv(project.name, action.arguments["--output"], action.node.url, lang, 'veracode')
-        if(action.arguments["--check"] or action.arguments["--dry-run"]):
-            print(dump_file)
-            print("---")
-        # if(action.arguments["--push"]):
-        #     update_file(project, '.gitlab-ci.yml', dump_file, branch)
-        time.sleep(int(action.arguments["--time"]))
-        # plugins_find(yaml_data, action.path, "clair_analysis")
+def report_plugins(action, name, lang, blob_id, text):
+    dump_file = render_plugins(action.arguments["blob_cache"], blob_id, text, lang)
+    print_plugins(action, name, lang, dump_file)
+    if is_push(action.arguments):
+        push_plugins(action, name, lang, blob_id, text, dump_file)
+    else:
+        finish(action, 'ok')
+    if(action.arguments["--recursive"]):
+        print_includes(action, action.arguments["blob_cache"].document(blob_id, text), action.arguments["--name"])
+
+def report_missing(action, ref):
+    # Not an error, --resume has nothing to retry until someone adds the file
+    log.info("No {file} at {ref} in {path}".format(file=CI_FILE, ref=ref, path=action.path))
+    record_result(action, action.node.name, None, 'plugins', 'missing')
+    finish(action, 'missing')
+
+def render_plugins(blob_cache, blob_id, text, lang):
+    return blob_cache.dump(blob_id, lang, text, lambda yaml_data: add_veracode(yaml_data, lang))
+
+def print_plugins(action, name, lang, dump_file):
+    # print(lang)
+    try:
+        print("project:\n- url: {url} \n- name: {name}\n- lang: \U0001F419 {lang}\n---".format(url = action.node.url, name=action.node.name, lang=lang))
+    except:
+        log.info(sys.exc_info())
+
+    record_result(action, name, lang, 'veracode', 'ok')
+    if(action.arguments["--check"] or action.arguments["--dry-run"]):
+        print(dump_file)
+        print("---")
+    # plugins_find(yaml_data, action.path, "clair_analysis")
+
+def is_push(arguments):
+    return arguments["--push"] and not arguments["--dry-run"]
+
+def start_ref(arguments):
+    # Base of --name when the branch does not exist yet, only used by --push
+    return arguments["--ref"] if arguments["--push"] and arguments["--ref"] != arguments["--name"] else None
+
+def get_ci_file(project, action):
+    try:
+        return project.files.get(file_path=CI_FILE, ref=action.arguments["--name"])
+    except GitlabGetError as e:
+        start = start_ref(action.arguments)
+        if e.response_code != 404 or start is None:
+            raise
+    # The commit that pushes the file also creates the branch
+    action.start_branch = start
+    return project.files.get(file_path=CI_FILE, ref=start)
+
+def push_plugins(action, name, lang, blob_id, text, dump_file):
+    if is_unchanged(action.arguments["blob_cache"], blob_id, text, dump_file):
+        log.debug("No changes to {file} in {path}".format(file=CI_FILE, path=action.path))
+        record_result(action, name, lang, 'push', 'unchanged')
+        finish(action, 'unchanged')
+        return
+    project = action.arguments["gitlab"].projects.get(action.node.id, lazy=True)
+    try:
+        update_file(project, CI_FILE, dump_file, action.arguments["--name"], getattr(action, 'start_branch', None))
+        record_result(action, name, lang, 'push', 'ok')
+        finish(action, 'ok')
+    except Exception as e:
+        log.info("Error pushing {file} to {path}: {error}".format(file=CI_FILE, path=action.path, error=e))
+        record_result(action, name, lang, 'push', 'error')
+        finish(action, 'error')
 
 def security_branch(action):
+    # --create and --remove go through branchplan, only the listing is per project
     if is_gitlab_project(action.node):
-        time.sleep(1)
         gitlab = action.arguments["gitlab"]
-        log.debug("updating existing project {0}".format(action.path))
-        project=get_project(gitlab, action.node.id)
-        # print(action.arguments)
-
-        if(action.arguments["--create"]):
-            try:
-                # check if pipeline should be create
-                ref = action.arguments["--ref"]
-                branch = action.arguments["--name"]
-                ## ToDo
-                check_ref_branch(project, ref)
-                # crete branch
-                time.sleep(1)
-                # create_branch(project, branch, ref)
-            except Exception as e:
-                log.fatal("Error: {}".format(e))    
-
-        if(action.arguments["--remove"]):
-            try:
-                delete_branch(project, branch)
-            except Exception as e:
-                log.fatal("Error: {}".format(e))
-        
-        if(action.arguments["--list"]):
-            list_branches(project, True)
+        project = gitlab.projects.get(action.node.id, lazy=True)
+        found = list_branches(project, action.node.name, True, action.arguments["--search"])
+        record_result(action, action.node.name, None, 'branch', branch_status(action.arguments, found))
+        return True
+
+def branch_status(arguments, found):
+    if arguments["--search"] is None:
+        return 'ok'
+    return 'found' if found else 'missing'
 
 ## ----------------------------------------------------------------------##
 ##                                                                       ##
@@ -131,13 +210,19 @@ def security_branch(action):
 ##                                                                       ##
 ## ----------------------------------------------------------------------##
 
-def dump_to_csv(project, path, url, lang, step):
-    try:
-      with open(path, newline='', mode='a') as file:
-          writer = csv.writer(file, delimiter=',')
-          writer.writerow([project, url, lang, step])
-    except Exception as e:
-        log.info("Error trying to openning the file output\nmsg:{}".format(sys.exc_info()))
+def record_result(action, name, lang, step, status):
+    sink = action.arguments.get("sink")
+    if sink is not None:
+        started = getattr(action, 'started', None)
+        seconds = round(time.monotonic() - started, 3) if started is not None else None
+        sink.push({'project': name, 'url': action.node.url, 'lang': lang,
+                   'step': step, 'status': status, 'seconds': seconds})
+
+def finish(action, status):
+    # Last word on a project, --resume skips it unless the status is an error
+    journal = action.arguments.get("journal")
+    if journal is not None and is_gitlab_project(action.node):
+        journal.record(action, status)
 
 def get_project(gitlab, id):
     try:
@@ -146,67 +231,84 @@ def get_project(gitlab, id):
         log.info(sys.exc_info())
     return project
 
-def list_branches(project, fig):
-    try:
-        log.debug("Listing branches in project {}".format(project.name))
+def list_branches(project, name, fig, search=None):
+    # Every page, fetched as the listing is printed, filtered by gitlab
+    log.debug("Listing branches in project {}".format(name))
+    branches = list_all(project.branches, per_page=100, search=search)
+    return print_branches(name, (branch.name for branch in branches), fig)
 
-        px = project.branches.list()
-        print("---\nProject {}".format(project.name))
-        smb = random.choices(emo, k=20) if fig else 20*['']
-        [print("- {name} {symbol}".format(symbol=smb[i], name= branch.name)) for i,branch in enumerate(px)]
-    except Exception as e:
-        log.info(e)
-        log.info(sys.exc_info())
+def print_branches(name, branches, fig):
+    print("---\nProject {}".format(name))
+    count = 0
+    for branch in branches:
+        print("- {name} {symbol}".format(symbol=random.choice(emo) if fig else '', name=branch))
+        count += 1
+    return count
 
 def create_branch(project, branch_name, ref_name):
     try:
         project.branches.create({'branch': branch_name, 'ref': ref_name})
+        return True
     except GitlabError:
         log.fatal("Branch error: {}".format(sys.exc_info()))
     except Exception as e:
-        log.info(e)    
+        log.info(e)
+    return False
 
 def delete_branch(project, branch_name):
     try:
         project.branches.delete(branch_name)
+        return True
     except GitlabError:
         log.fatal("Branch error: {}".format(sys.exc_info()))
     except Exception as e:
         log.info(e)
+    return False
 
-def get_file(project, file_name, branch):
+def get_file(project, file_name, branch, name=None):
     try:
-        log.debug(project.name)
+        log.debug("Getting {file} of {name} at {branch}".format(file=file_name, name=name, branch=branch))
         file_object=project.files.get(file_path=file_name, ref=branch)
         return file_object
     except:
         log.debug("Error get file")
         log.fatal("error : {}".format(sys.exc_info()))
 
-def get_yaml(project, file_name, branch):
-    file_object = get_file(project, file_name, branch)
+def get_yaml(project, file_name, branch, name=None):
+    file_object = get_file(project, file_name, branch, name)
+    yaml_file = None
     try:
-        yaml_file = yaml.safe_load(file_object.decode().decode('utf-8'))
+        yaml_file = load_yaml(file_object.decode().decode('utf-8'))
     except:
         log.debug(sys.exc_info())
     return yaml_file
 
-def update_file(project, file_name, new_file, branch_name):
-    try:
-        log.info(project.name)
-        file_object=project.files.get(file_path=file_name, ref=branch_name)
-        file_object.content = new_file
-        push_file(file_object, branch_name, file_name)
-        log.info("Pushed file")
-    except:
-        log.debug("Error get file")
-        log.fatal("error update file: {}".format(sys.exc_info()))
+def blob_sha(text):
+    # Same id gitlab gives to the blob
+    data = text.encode('utf-8')
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
 
-def push_file(file, branch, filename):
-    try:
-        file.save(branch=branch, commit_message="ci: add sec step {step} to {name} from revisor script".format(step="veracode" ,name=filename))
-    except GitlabError:
-        log.debug("[Failed to push the file] : {0}".format(sys.exc_info()))
+def canonical_hash(document):
+    return hashlib.sha256(json.dumps(document, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def is_unchanged(blob_cache, blob_id, text, new_file):
+    if blob_sha(new_file) == blob_id:
+        return True
+    # Only the layout of the file changed, not the pipeline
+    return canonical_hash(load_yaml(new_file)) == canonical_hash(blob_cache.document(blob_id, text))
+
+def commit_data(file_name, new_file, branch_name, start_branch=None):
+    data = {'branch': branch_name,
+            'commit_message': "ci: add sec step {step} to {name} from revisor script".format(step="veracode", name=file_name),
+            'actions': [{'action': 'update', 'file_path': file_name, 'content': new_file}]}
+    if start_branch is not None:
+        data['start_branch'] = start_branch
+    return data
+
+def update_file(project, file_name, new_file, branch_name, start_branch=None):
+    # One request, creating branch_name from start_branch when given
+    log.debug("Pushing {file} to {branch} of {name}".format(file=file_name, branch=branch_name, name=project.id))
+    return project.commits.create(commit_data(file_name, new_file, branch_name, start_branch))
 
 def plugins_find(yaml_data, name, type_stage):
     print("Reviewing repository {0} \n".format(name))
@@ -220,8 +322,16 @@ def plugins_find(yaml_data, name, type_stage):
         yaml_file, default_flow_style=False, sort_keys=False)
     return dump_file
 
-def check_ref_branch(project, ref):
-    yaml_data = get_yaml(project, '.gitlab-ci.yml', ref)
+def check_ref_branch(action, project, ref):
+    yaml_data = get_yaml(project, CI_FILE, ref, action.node.name)
+    if yaml_data is None:
+        log.info("No CI file to review in {ref} of {name}".format(ref=ref, name=action.node.name))
+        return
+    print_stages(yaml_data)
+    if(action.arguments["--recursive"]):
+        print_includes(action, yaml_data, ref)
+
+def print_stages(yaml_data):
     [print(stage) for stage in yaml_data]
     # for stage_name in yaml:
     #     print("Stage : {}".format(stage_name))
@@ -230,35 +340,51 @@ def check_ref_branch(project, ref):
     #         if(steps == 'only'):
     #             print("Stage {} has only {} ".format(stage_name,steps['only']))
 
-def get_lang(project, yaml_file):
+def print_includes(action, yaml_data, ref):
+    print_include_nodes(action.arguments["include_resolver"].resolve(yaml_data, action.node.id, ref))
+
+def print_include_nodes(nodes):
+    jobs = []
+    print("includes:")
+    for depth, node in nodes:
+        if depth:
+            print("{indent}- {name}{error}".format(indent='  '*(depth-1), name=key_name(node.key),
+                                                   error=" \u274C" if node.error else ""))
+        if isinstance(node.document, dict):
+            jobs.extend(name for name in node.document if name not in gitlab_keywords and not name.startswith('.'))
+    print("jobs: {}\n---".format(", ".join(jobs)))
+
+def get_lang(project, yaml_file, lang_cache, node):
     try:
-        lang = []
-        lang_dict = project.languages()
-        if(bool(lang_dict)):
-            for lang_name, por in lang_dict.items():
-                lang.append(lang_name)
-            return lang[0]
-        else:
-            lang = yaml_file["variables"]
-            flagj = False
-            flagn = False
-            for l,_ in lang.items():
-                if "gradle" in l.lower():
-                    flagj = True
-                    flagn = False
-                if "npm" in l.lower():
-                    flagn = True
-                    flagj = False
-            
-            if flagj:
-                return 'Java'
-            if flagn:
-                return 'Node'    
-            else:
-                return "404notfound"
+        return lang_from(lang_cache.languages(node, project.languages), yaml_file)
     except:
         log.info(sys.exc_info())
 
+def lang_from(lang_dict, yaml_file):
+    lang = []
+    if(bool(lang_dict)):
+        for lang_name, por in lang_dict.items():
+            lang.append(lang_name)
+        return lang[0]
+    else:
+        lang = yaml_file["variables"]
+        flagj = False
+        flagn = False
+        for l,_ in lang.items():
+            if "gradle" in l.lower():
+                flagj = True
+                flagn = False
+            if "npm" in l.lower():
+                flagn = True
+                flagj = False
+
+        if flagj:
+            return 'Java'
+        if flagn:
+            return 'Node'
+        else:
+            return "404notfound"
+
 def modify_file_content(file_object, url):
     yaml_file=yaml.safe_load(file_object.decode().decode('utf-8'))
     print("\n")
@@ -334,12 +460,20 @@ def add_security_steps(data, lang):
     return data
 
 def add_veracode(yaml_file, lang):
-    yaml_file["include"].extend( [
+    yaml_file.setdefault("include", []).extend( [
              {'file': '/template/.ci-template.yml',
               'project': 'tech-corp/seguridad-de-la-informacion/ci-templates/veracode-plugin',
               'ref': 'v-2.0-19.6.5.8'}])
-    # Deduplication of dictionaries              
-    yaml_file["include"] = [dict(t) for t in {tuple(d.items()) for d in yaml_file["include"]}]
+    # Deduplication of dictionaries, keeping their order so the same input
+    # always renders the same file and a push can tell when nothing changed
+    seen = set()
+    includes = []
+    for include in yaml_file["include"]:
+        key = tuple(include.items()) if isinstance(include, dict) else include
+        if key not in seen:
+            seen.add(key)
+            includes.append(include)
+    yaml_file["include"] = includes
     # End deduplication of dictionaries
 
     if(lang.lower() == 'java'):
@@ -372,51 +506,63 @@ def add_veracode(yaml_file, lang):
 
     return yaml_file
 
+def clone_command(url, path, arguments):
+    strategy = arguments["--clone-strategy"]
+    command = ['git', 'clone']
+    if strategy == 'shallow':
+        command += ['--depth', arguments["--depth"], '--single-branch']
+    elif strategy == 'blobless':
+        command += ['--filter=blob:none']
+    elif strategy == 'treeless':
+        command += ['--filter=tree:0']
+    elif strategy == 'sparse':
+        command += ['--filter=blob:none', '--sparse']
+    return command + [url, path]
+
+def sparse_command(path, arguments):
+    return ['git', '-C', path, 'sparse-checkout', 'set', '--no-cone'] + arguments["--sparse-paths"].split(",")
+
+def pull_commands(path, arguments):
+    # Partial clone filters and sparse patterns live in the repo config, pull keeps them
+    if arguments["--clone-strategy"] != 'shallow':
+        return [['git', '-C', path, 'pull']]
+    # A shallow history cannot be merged with the new one, the checkout moves to what was fetched
+    return [['git', '-C', path, 'fetch', '--depth', arguments["--depth"], 'origin', 'HEAD'],
+            ['git', '-C', path, 'reset', '-q', '--hard', 'FETCH_HEAD']]
+
+def reset_dir(path):
+    # A killed clone leaves a partial repository behind
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+def pull_project(action):
+    log.debug("updating existing project {}".format(action.path))
+    progress.show_progress(action.node.name, 'pull')
+    return action.arguments["git_runner"].run(action.path, 'pull', pull_commands(action.path, action.arguments))
+
+def clone_project(action):
+    log.debug("cloning new project {}".format(action.path))
+    progress.show_progress(action.node.name, 'clone')
+    commands = [clone_command(action.node.url, action.path, action.arguments)]
+    if action.arguments["--clone-strategy"] == 'sparse':
+        commands.append(sparse_command(action.path, action.arguments))
+    return action.arguments["git_runner"].run(action.path, 'clone', commands,
+                                              cleanup=lambda: reset_dir(action.path))
+
 def pull_project_ci_file(action):
     if is_git_repo(action.path):
-        '''
-        Update existing project
-        '''
-        log.debug("updating existing project {}".format(action.path))
-        progress.show_progress(action.node.name, 'pull')
-        try:
-            repo=git.Repo(action.path)
-            repo.remotes.origin.pull()
-        except KeyboardInterrupt:
-            log.fatal("User interrupted")
-            sys.exit(0)
-        except Exception as e:
-            log.debug("Error pulling project {}".format(
-                action.path), exc_info=True)
-
+        pull_project(action)
 
 def clone_or_pull_project(action):
+    manifest = action.arguments.get("manifest")
+    if manifest is not None and manifest.is_synced(action):
+        log.debug("skipping unchanged project {}".format(action.path))
+        progress.show_progress(action.node.name, 'skip')
+        return
     if is_git_repo(action.path):
-        '''
-        Update existing project
-        '''
-        log.debug("updating existing project {}".format(action.path))
-        progress.show_progress(action.node.name, 'pull')
-        try:
-            repo=git.Repo(action.path)
-            repo.remotes.origin.pull()
-        except KeyboardInterrupt:
-            log.fatal("User interrupted")
-            sys.exit(0)
-        except Exception as e:
-            log.debug("Error pulling project {}".format(
-                action.path), exc_info=True)
+        synced = pull_project(action)
     else:
-        '''
-        Clone new project
-        '''
-        log.debug("cloning new project {}".format(action.path))
-        progress.show_progress(action.node.name, 'clone')
-        try:
-            git.Repo.clone_from(action.node.url, action.path)
-        except KeyboardInterrupt:
-            log.fatal("User interrupted")
-            sys.exit(0)
-        except Exception as e:
-            log.debug("Error cloning project {}".format(
-                action.path), exc_info=True)
+        synced = clone_project(action)
+    if synced and manifest is not None:
+        manifest.record(action)
+    return synced
@@ -0,0 +1,114 @@
+import subprocess
+import threading
+import logging
+import signal
+import time
+import csv
+import os
+
+log = logging.getLogger(__name__)
+
+
+def git_output(path, *args):
+    # Short local commands, read for their output, raise CalledProcessError when git fails
+    return subprocess.run(['git', '-C', path] + list(args), check=True, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE).stdout.decode('utf-8', 'replace')
+
+
+class GitResult:
+    def __init__(self, path, operation):
+        self.path = path
+        self.operation = operation
+        self.attempts = 0
+        self.duration = 0.0
+        self.ok = False
+        self.output = None
+        self.errors = []
+
+
+class GitRunner:
+    def __init__(self, concurrency=4, timeout=600, retries=1):
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.timeout = timeout
+        self.retries = retries
+        self.results = []
+        self.running = set()
+        self.lock = threading.Lock()
+
+    def run_once(self, command):
+        # Own session, so a timeout kills git and its ssh/remote helpers together
+        env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   env=env, start_new_session=True)
+        with self.lock:
+            self.running.add(process)
+        try:
+            stdout, stderr = process.communicate(timeout=self.timeout)
+            return process.returncode == 0, stdout.decode('utf-8', 'replace'), stderr.decode('utf-8', 'replace').strip()
+        except subprocess.TimeoutExpired:
+            self.kill(process)
+            process.communicate()
+            return False, None, "killed after {}s: {}".format(self.timeout, " ".join(command))
+        finally:
+            with self.lock:
+                self.running.discard(process)
+
+    def run(self, path, operation, commands, cleanup=None):
+        return self.attempt(path, operation, commands, cleanup).ok
+
+    def output(self, path, operation, command):
+        # Commands read for their output, like ls-remote, share the slots and the timeout
+        result = self.attempt(path, operation, [command])
+        return result.output if result.ok else None
+
+    def attempt(self, path, operation, commands, cleanup=None):
+        result = GitResult(path, operation)
+        start = time.monotonic()
+        with self.slots:
+            while not result.ok and result.attempts <= self.retries:
+                if result.attempts and cleanup is not None:
+                    cleanup()
+                result.attempts += 1
+                for command in commands:
+                    log.debug("Running {}".format(" ".join(command)))
+                    result.ok, result.output, stderr = self.run_once(command)
+                    if not result.ok:
+                        result.errors.append(stderr)
+                        break
+        result.duration = time.monotonic() - start
+        with self.lock:
+            self.results.append(result)
+        if not result.ok:
+            log.debug("Error in {operation} of {path}: {error}".format(
+                operation=operation, path=path, error=result.errors[-1]))
+        return result
+
+    def kill(self, process):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def terminate(self):
+        with self.lock:
+            running = list(self.running)
+        for process in running:
+            self.kill(process)
+
+    def report(self, path=None, slowest=10):
+        failed = [result for result in self.results if not result.ok]
+        for result in failed:
+            log.info("Failed {operation} of {path} after {attempts} attempts:\n{errors}".format(
+                operation=result.operation, path=result.path, attempts=result.attempts,
+                errors="\n".join(result.errors)))
+        for result in sorted(self.results, key=lambda r: r.duration, reverse=True)[:slowest]:
+            log.debug("{operation} of {path} took {duration:.2f}s".format(
+                operation=result.operation, path=result.path, duration=result.duration))
+        if path is not None:
+            with open(path, newline='', mode='w') as file:
+                writer = csv.writer(file, delimiter=',')
+                writer.writerow(['path', 'operation', 'seconds', 'attempts', 'status'])
+                for result in self.results:
+                    writer.writerow([result.path, result.operation, "{:.3f}".format(result.duration),
+                                     result.attempts, 'ok' if result.ok else 'failed'])
+        return failed
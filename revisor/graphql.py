@@ -0,0 +1,203 @@
+import concurrent.futures
+import logging
+import sys
+import time
+import git
+import pipeline
+
+log = logging.getLogger(__name__)
+
+# Largest page of a connection gitlab answers, the rest would read as missing
+MAX_BATCH = 100
+PLUGINS_QUERY = """
+query($ids: [ID!], $ref: String!, $paths: [String!]!, $first: Int) {
+  projects(ids: $ids, first: $first) {
+    nodes {
+      id
+      repository {
+        blobs(paths: $paths, ref: $ref) { nodes { path oid rawBlob } }
+      }
+      languages { name share }
+    }
+  }
+}
+"""
+LANGUAGES_QUERY = """
+query($ids: [ID!], $first: Int) {
+  projects(ids: $ids, first: $first) {
+    nodes { id languages { name share } }
+  }
+}
+"""
+
+BRANCHES_QUERY = """
+query($ids: [ID!], $first: Int, $pattern: String!, $limit: Int!) {
+  projects(ids: $ids, first: $first) {
+    nodes { id repository { branchNames(searchPattern: $pattern, offset: 0, limit: $limit) } }
+  }
+}
+"""
+
+
+def global_ids(ids):
+    return ["gid://gitlab/Project/{}".format(id) for id in ids]
+
+
+def project_id(node):
+    return int(node['id'].rsplit('/', 1)[-1])
+
+
+def languages_of(node):
+    # Same order as the REST languages endpoint, biggest share first
+    languages = sorted(node.get('languages') or [], key=lambda l: l['share'] or 0, reverse=True)
+    return {l['name']: l['share'] for l in languages}
+
+
+class GraphqlClient:
+    def __init__(self, url, token, session, timeout=None):
+        self.url = "{}/api/graphql".format(url.rstrip('/'))
+        self.headers = {'Authorization': 'Bearer {}'.format(token)}
+        self.session = session
+        self.timeout = timeout
+
+    def query(self, query, variables):
+        response = self.session.post(self.url, json={'query': query, 'variables': variables},
+                                     headers=self.headers, timeout=self.timeout)
+        response.raise_for_status()
+        result = response.json()
+        if result.get('errors'):
+            raise RuntimeError("GraphQL errors: {}".format(result['errors']))
+        return result['data']
+
+    def plugins_batch(self, ids, ref):
+        data = self.query(PLUGINS_QUERY, {'ids': global_ids(ids), 'ref': ref, 'paths': [git.CI_FILE],
+                                          'first': len(ids)})
+        projects = {}
+        for node in data['projects']['nodes']:
+            blobs = (node.get('repository') or {}).get('blobs') or {'nodes': []}
+            projects[project_id(node)] = {'blob': next(iter(blobs['nodes']), None),
+                                          'languages': languages_of(node)}
+        return projects
+
+    def languages_batch(self, ids):
+        data = self.query(LANGUAGES_QUERY, {'ids': global_ids(ids), 'first': len(ids)})
+        return {project_id(node): languages_of(node) for node in data['projects']['nodes']}
+
+    def branches_batch(self, ids, pattern, limit=100):
+        data = self.query(BRANCHES_QUERY, {'ids': global_ids(ids), 'first': len(ids), 'pattern': pattern,
+                                           'limit': limit})
+        return {project_id(node): (node.get('repository') or {}).get('branchNames') or []
+                for node in data['projects']['nodes']}
+
+
+def batches(actions, size):
+    size = min(size, MAX_BATCH)
+    batch = []
+    for action in actions:
+        if git.is_gitlab_project(action.node):
+            batch.append(action)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def fallback(client, batch, projects):
+    # Projects without the branch are read from the base ref, the push creates the branch
+    start = git.start_ref(batch[0].arguments)
+    missing = [action for action in batch if (projects.get(action.node.id) or {}).get('blob') is None]
+    if start is None or not missing:
+        return
+    found = client.plugins_batch([action.node.id for action in missing], start)
+    for action in missing:
+        project = found.get(action.node.id)
+        if project is not None and project['blob'] is not None:
+            action.start_branch = start
+            projects[action.node.id] = project
+
+
+def plugins_batch(client, batch):
+    ref = batch[0].arguments["--name"]
+    started = time.monotonic()
+    for action in batch:
+        action.started = started
+    try:
+        projects = client.plugins_batch([action.node.id for action in batch], ref)
+        fallback(client, batch, projects)
+    except Exception:
+        log.info("Error fetching batch of [{}] projects: {}".format(len(batch), sys.exc_info()))
+        for action in batch:
+            git.record_result(action, action.node.name, None, 'plugins', 'error')
+            git.finish(action, 'error')
+        return
+    for action in batch:
+        git.progress.show_progress(action.node.name, 'plugins')
+        project = projects.get(action.node.id)
+        if project is None or project['blob'] is None:
+            git.report_missing(action, ref)
+            continue
+        # One broken project is recorded, the rest of the batch carries on
+        try:
+            report_project(action, project)
+        except Exception as e:
+            pipeline.report_error(action, 'plugins', e)
+
+
+def report_project(action, project):
+    # Languages come with the batch anyway, they keep the cache warm for the other engines
+    action.arguments["lang_cache"].put(action.node, project['languages'])
+    blob = project['blob']
+    text = lambda: blob['rawBlob']
+    yaml_data = action.arguments["blob_cache"].document(blob['oid'], text)
+    try:
+        lang = git.lang_from(project['languages'], yaml_data)
+    except:
+        lang = None
+        log.info(sys.exc_info())
+    git.report_plugins(action, action.node.name, lang, blob['oid'], text)
+
+
+def make_client(arguments):
+    return GraphqlClient(arguments["url_base"], arguments["token"], arguments["gitlab"].session,
+                         timeout=float(arguments["--timeout"]))
+
+
+def languages_batch(client, cache, batch):
+    try:
+        languages = client.languages_batch([action.node.id for action in batch])
+    except Exception:
+        # Left for the plugins action, which fetches them one by one
+        log.info("Error fetching languages of [{}] projects: {}".format(len(batch), sys.exc_info()))
+        return 0
+    for action in batch:
+        cache.put(action.node, languages.get(action.node.id))
+    return len(batch)
+
+
+def refresh_languages(actions, arguments):
+    # Only projects missing from the cache, changed or expired are asked for
+    cache = arguments["lang_cache"]
+    stale = (action for action in actions if git.is_gitlab_project(action.node) and not cache.is_cached(action.node))
+    client = make_client(arguments)
+    workers = int(arguments["--concurrency"])
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        submit = lambda batch: executor.submit(languages_batch, client, cache, batch)
+        refreshed = 0
+        for _, num, error in pipeline.bounded(batches(stale, int(arguments["--batch"])), submit, workers):
+            if error is not None:
+                raise error
+            refreshed += num
+    cache.save()
+    log.debug("Refreshed languages of [{}] projects".format(refreshed))
+
+
+def sync_plugins_graphql(actions, arguments):
+    # Batches are only built as workers free up, like the other engines
+    client = make_client(arguments)
+    workers = int(arguments["--concurrency"])
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        submit = lambda batch: executor.submit(plugins_batch, client, batch)
+        for _, _, error in pipeline.bounded(batches(actions, int(arguments["--batch"])), submit, workers):
+            if error is not None:
+                raise error
@@ -0,0 +1,105 @@
+import threading
+import logging
+import sys
+from blobcache import load_yaml
+
+log = logging.getLogger(__name__)
+
+TEMPLATE_SUFFIX = '.gitlab-ci.yml'
+
+
+def include_keys(document, project, ref):
+    includes = document.get('include', []) if isinstance(document, dict) else []
+    if isinstance(includes, (str, dict)):
+        includes = [includes]
+    for include in includes:
+        if isinstance(include, str):
+            if include.startswith(('http://', 'https://')):
+                yield ('remote', include)
+            else:
+                yield ('file', project, include.lstrip('/'), ref)
+        elif 'local' in include:
+            yield ('file', project, include['local'].lstrip('/'), ref)
+        elif 'project' in include:
+            files = include.get('file', [])
+            for file_name in [files] if isinstance(files, str) else files:
+                yield ('file', include['project'], file_name.lstrip('/'), include.get('ref', 'HEAD'))
+        elif 'template' in include:
+            yield ('template', include['template'])
+        elif 'remote' in include:
+            yield ('remote', include['remote'])
+
+
+def key_name(key):
+    if key[0] == 'file':
+        return "{project}:/{file}@{ref}".format(project=key[1], file=key[2], ref=key[3])
+    return "{kind}:{name}".format(kind=key[0], name=key[1])
+
+
+class IncludeNode:
+    def __init__(self, key):
+        self.key = key
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.document = None
+        self.includes = []
+        self.error = None
+
+
+class IncludeResolver:
+    def __init__(self, gitlab, blob_cache):
+        self.gitlab = gitlab
+        self.blob_cache = blob_cache
+        self.nodes = {}
+        self.lock = threading.Lock()
+
+    def fetch(self, key):
+        if key[0] == 'file':
+            project = self.gitlab.projects.get(key[1], lazy=True)
+            file_object = project.files.get(file_path=key[2], ref=key[3])
+            return self.blob_cache.document(file_object.blob_id, lambda: file_object.decode().decode('utf-8'))
+        if key[0] == 'template':
+            name = key[1]
+            if name.endswith(TEMPLATE_SUFFIX):
+                name = name[:-len(TEMPLATE_SUFFIX)]
+            return load_yaml(self.gitlab.gitlabciymls.get(name).content)
+        # Remote includes live outside of gitlab, they are kept as leaves
+        return None
+
+    def node(self, key):
+        # Each (project, file, ref) is fetched once per run, whoever asks first loads it
+        with self.lock:
+            node = self.nodes.get(key)
+            if node is None:
+                node = self.nodes[key] = IncludeNode(key)
+        with node.lock:
+            if not node.loaded:
+                try:
+                    node.document = self.fetch(key)
+                    project, ref = (key[1], key[3]) if key[0] == 'file' else (None, None)
+                    node.includes = list(include_keys(node.document, project, ref))
+                except Exception:
+                    node.error = sys.exc_info()[1]
+                    log.debug("Error resolving include {}".format(key_name(key)), exc_info=True)
+                node.loaded = True
+        return node
+
+    def resolve(self, document, project, ref):
+        # Depth first over the include graph, every node shows up once
+        root = IncludeNode(('file', project, '.gitlab-ci.yml', ref))
+        root.document = document
+        root.includes = list(include_keys(document, project, ref))
+        root.loaded = True
+        seen = set()
+        nodes = []
+
+        def walk(node, depth):
+            nodes.append((depth, node))
+            for key in node.includes:
+                if key in seen:
+                    continue
+                seen.add(key)
+                walk(self.node(key), depth + 1)
+
+        walk(root, 0)
+        return nodes
@@ -0,0 +1,255 @@
+from datetime import datetime, timezone
+import concurrent.futures
+import logging
+import sqlite3
+import sys
+import git
+import pipeline
+from gitlab import GitlabGetError
+from includes import key_name
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (id INTEGER PRIMARY KEY, name TEXT, path TEXT, url TEXT,
+    last_activity_at TEXT, ref TEXT, blob_sha TEXT, lang TEXT, indexed_at TEXT);
+CREATE TABLE IF NOT EXISTS documents (sha TEXT PRIMARY KEY, content TEXT);
+CREATE TABLE IF NOT EXISTS languages (project_id INTEGER, name TEXT, share REAL);
+CREATE TABLE IF NOT EXISTS includes (project_id INTEGER, depth INTEGER, kind TEXT, project TEXT, file TEXT,
+    ref TEXT, name TEXT, error INTEGER);
+CREATE TABLE IF NOT EXISTS jobs (project_id INTEGER, name TEXT, stage TEXT, image TEXT, source TEXT);
+CREATE INDEX IF NOT EXISTS languages_project ON languages (project_id);
+CREATE INDEX IF NOT EXISTS includes_project ON includes (project_id);
+CREATE INDEX IF NOT EXISTS includes_file ON includes (file);
+CREATE INDEX IF NOT EXISTS jobs_project ON jobs (project_id);
+CREATE INDEX IF NOT EXISTS jobs_name ON jobs (name);
+CREATE INDEX IF NOT EXISTS jobs_image ON jobs (image);
+"""
+PROJECT_TABLES = ('languages', 'includes', 'jobs')
+# Writes of this many projects share a transaction
+COMMIT_EVERY = 500
+
+
+def image_name(image):
+    return image.get('name') if isinstance(image, dict) else image
+
+
+def job_rows(project_id, document, source):
+    if not isinstance(document, dict):
+        return []
+    default = document.get('default') if isinstance(document.get('default'), dict) else {}
+    image = image_name(document.get('image', default.get('image')))
+    rows = []
+    for name, job in document.items():
+        if name in git.gitlab_keywords or name.startswith('.') or not isinstance(job, dict):
+            continue
+        # A job without an image runs on the default one
+        rows.append((project_id, name, job.get('stage', 'test'), image_name(job.get('image', image)), source))
+    return rows
+
+
+def include_row(project_id, depth, node):
+    key = node.key
+    if key[0] == 'file':
+        project, file, ref, name = key[1], key[2], key[3], key_name(key)
+    else:
+        project, file, ref, name = None, key[1], None, key_name(key)
+    return (project_id, depth, key[0], str(project) if project is not None else None, file, ref, name,
+            1 if node.error else 0)
+
+
+def fetch(action, known_sha):
+    # Runs in a thread, everything that talks to gitlab happens here
+    arguments = action.arguments
+    ref = arguments["--name"]
+    project = arguments["gitlab"].projects.get(action.node.id, lazy=True)
+    try:
+        file_object = project.files.get(file_path=git.CI_FILE, ref=ref)
+    except GitlabGetError as e:
+        if e.response_code != 404:
+            raise
+        return None
+    if file_object.blob_id == known_sha:
+        return {'sha': known_sha}
+    text = file_object.decode().decode('utf-8')
+    document = arguments["blob_cache"].document(file_object.blob_id, lambda: text)
+    languages = arguments["lang_cache"].languages(action.node, project.languages)
+    try:
+        lang = git.lang_from(languages, document)
+    except:
+        lang = None
+        log.debug(sys.exc_info())
+    nodes = arguments["include_resolver"].resolve(document, action.node.id, ref)
+    return {'sha': file_object.blob_id, 'text': text, 'languages': languages, 'lang': lang, 'nodes': nodes}
+
+
+class Index:
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        self.pending = 0
+        self.visited = set()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def known(self, id):
+        self.visited.add(id)
+        return self.db.execute("SELECT last_activity_at, ref, blob_sha, lang FROM projects WHERE id = ?",
+                               (id,)).fetchone()
+
+    def is_current(self, action, row):
+        # Nothing happened in the project since it was indexed from the same ref
+        activity = getattr(action.node, 'last_activity_at', None)
+        return row is not None and activity is not None and row[0] == activity and row[1] == action.arguments["--name"]
+
+    def write_project(self, action, blob_sha, lang):
+        node = action.node
+        self.db.execute("INSERT OR REPLACE INTO projects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (node.id, node.name, node.root_path, node.url, getattr(node, 'last_activity_at', None),
+                         action.arguments["--name"], blob_sha, lang, datetime.now(timezone.utc).isoformat()))
+
+    def touch(self, action):
+        # Same CI file, only the tree data of the project or the ref it was read from may have moved
+        node = action.node
+        self.db.execute("UPDATE projects SET name = ?, path = ?, url = ?, last_activity_at = ?, ref = ?, indexed_at = ? "
+                        "WHERE id = ?", (node.name, node.root_path, node.url, getattr(node, 'last_activity_at', None),
+                                         action.arguments["--name"], datetime.now(timezone.utc).isoformat(), node.id))
+
+    def clear(self, id):
+        for table in PROJECT_TABLES:
+            self.db.execute("DELETE FROM {} WHERE project_id = ?".format(table), (id,))
+
+    def write(self, action, result):
+        id = action.node.id
+        if result is None:
+            self.clear(id)
+            self.write_project(action, None, None)
+            return 'missing'
+        if 'text' not in result:
+            self.touch(action)
+            return 'unchanged'
+        self.clear(id)
+        self.write_project(action, result['sha'], result['lang'])
+        self.db.execute("INSERT OR IGNORE INTO documents VALUES (?, ?)", (result['sha'], result['text']))
+        self.db.executemany("INSERT INTO languages VALUES (?, ?, ?)",
+                            [(id, name, share) for name, share in (result['languages'] or {}).items()])
+        jobs = []
+        for depth, node in result['nodes']:
+            jobs.extend(job_rows(id, node.document, key_name(node.key) if depth else ""))
+        self.db.executemany("INSERT INTO jobs VALUES (?, ?, ?, ?, ?)", jobs)
+        self.db.executemany("INSERT INTO includes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            [include_row(id, depth, node) for depth, node in result['nodes'] if depth])
+        return 'indexed'
+
+    def prune(self):
+        # Only after a run over the whole tree, projects it did not reach have left it
+        gone = [id for id, in self.db.execute("SELECT id FROM projects") if id not in self.visited]
+        for id in gone:
+            self.clear(id)
+            self.db.execute("DELETE FROM projects WHERE id = ?", (id,))
+        log.debug("Removed [{}] projects no longer in the tree from the index".format(len(gone)))
+        return gone
+
+    def commit(self):
+        self.pending += 1
+        if self.pending >= COMMIT_EVERY:
+            self.db.commit()
+            self.pending = 0
+
+
+def changed(index, actions):
+    # Pulled by the writer thread, so the lookups share its connection
+    for action in actions:
+        if not git.is_gitlab_project(action.node):
+            continue
+        row = index.known(action.node.id)
+        if index.is_current(action, row):
+            index.touch(action)
+            index.commit()
+            git.progress.show_progress(action.node.name, 'unchanged')
+            git.record_result(action, action.node.name, row[3], 'index', 'unchanged')
+            git.finish(action, 'unchanged')
+            continue
+        yield action, row
+
+
+def sync_index(actions, arguments):
+    # Threads fetch, the calling thread is the only writer of the database
+    index = Index(arguments["<database>"])
+    workers = int(arguments["--concurrency"])
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            submit = lambda item: executor.submit(fetch, item[0], item[1][2] if item[1] else None)
+            for (action, row), result, error in pipeline.bounded(changed(index, actions), submit, 2 * workers):
+                git.progress.show_progress(action.node.name, 'index')
+                if error is not None:
+                    pipeline.report_error(action, 'index', error)
+                    continue
+                status = index.write(action, result)
+                index.commit()
+                lang = row[3] if status == 'unchanged' else result and result.get('lang')
+                git.record_result(action, action.node.name, lang, 'index', status)
+                git.finish(action, status)
+        if arguments.get("shard") is None and not arguments["--resume"]:
+            index.prune()
+    finally:
+        index.close()
+
+
+def query(path, job=None, missing=False, image=None, template=None, include_file=None, include_project=None,
+          at=None, lang=None):
+    # Glob patterns, like node:10* or *veracode*, every condition given has to hold
+    conditions, parameters = [], []
+    if job is not None:
+        conditions.append("{} EXISTS (SELECT 1 FROM jobs j WHERE j.project_id = p.id AND j.name GLOB ?)".format(
+            "NOT" if missing else ""))
+        parameters.append(job)
+    if image is not None:
+        conditions.append("EXISTS (SELECT 1 FROM jobs j WHERE j.project_id = p.id AND j.image GLOB ?)")
+        parameters.append(image)
+    if template is not None:
+        conditions.append("EXISTS (SELECT 1 FROM includes i WHERE i.project_id = p.id AND i.kind = 'template' "
+                          "AND i.file GLOB ?)")
+        parameters.append(template)
+    if include_file is not None or include_project is not None or at is not None:
+        include = ["i.project_id = p.id", "i.kind = 'file'"]
+        for column, value in (('file', include_file), ('project', include_project), ('ref', at)):
+            if value is not None:
+                include.append("i.{} GLOB ?".format(column))
+                parameters.append(value)
+        conditions.append("EXISTS (SELECT 1 FROM includes i WHERE {})".format(" AND ".join(include)))
+    if lang is not None:
+        conditions.append("p.lang GLOB ?")
+        parameters.append(lang)
+    sql = "SELECT p.path, p.url FROM projects p{where} ORDER BY p.path".format(
+        where=" WHERE " + " AND ".join(conditions) if conditions else "")
+    db = sqlite3.connect("file:{}?mode=ro".format(path), uri=True)
+    try:
+        return db.execute(sql, parameters).fetchall()
+    finally:
+        db.close()
+
+
+def sql_query(path, sql):
+    db = sqlite3.connect("file:{}?mode=ro".format(path), uri=True)
+    try:
+        cursor = db.execute(sql)
+        return [tuple(column[0] for column in cursor.description or [])] + cursor.fetchall()
+    finally:
+        db.close()
+
+
+def print_query(arguments):
+    path = arguments["<database>"]
+    if arguments["--sql"] is not None:
+        rows = sql_query(path, arguments["--sql"])
+    else:
+        rows = query(path, job=arguments["--job"], missing=arguments["--missing"], image=arguments["--image"],
+                     template=arguments["--template"], include_file=arguments["--include-file"],
+                     include_project=arguments["--include-project"], at=arguments["--at"], lang=arguments["--lang"])
+    for row in rows:
+        print(" ".join("" if value is None else str(value) for value in row))
+    log.debug("Query matched [{}] rows".format(len(rows)))
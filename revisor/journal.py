@@ -0,0 +1,64 @@
+from datetime import datetime, timezone
+import hashlib
+import logging
+import json
+import os
+from sink import ResultSink, open_text
+
+log = logging.getLogger(__name__)
+
+# Arguments that change what a run does to a project, a resume only trusts runs that agree on them
+RUN_ARGUMENTS = ['--gitlab', '--name', '--ref', '--list', '--create', '--remove', '--search', '--check', '--push',
+                 '--sast', '--dependency-check', '--detect-secrets', '--add-veracode', '--recursive', '--offline',
+                 '--clone-strategy', '<path>']
+
+
+def run_key(action, arguments):
+    run = {name: arguments.get(name) for name in RUN_ARGUMENTS}
+    run['action'] = action
+    return hashlib.sha1(json.dumps(run, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+class Journal:
+    def __init__(self, path, action, arguments, resume=False):
+        self.path = path
+        self.action = action
+        self.key = run_key(action, arguments)
+        self.done = self.load() if resume else set()
+        self.sink = ResultSink(path, 'jsonl').start()
+
+    def load(self):
+        # Last outcome of every project in earlier runs of the same work, errors are retried
+        status = {}
+        if os.path.exists(self.path):
+            with open_text(self.path, 'r') as stream:
+                try:
+                    for line in stream:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            # A run killed in the middle of a write leaves half a line
+                            continue
+                        if entry.get('run') == self.key:
+                            status[entry['id']] = entry['status']
+                except EOFError:
+                    # or, compressed, a gzip member without its end
+                    log.info("Journal [{}] ends in a truncated gzip member".format(self.path))
+        done = {id for id, last in status.items() if last != 'error'}
+        log.debug("Resuming [{action}] from [{path}], [{done}] projects done and [{failed}] failed".format(
+            action=self.action, path=self.path, done=len(done), failed=len(status) - len(done)))
+        return done
+
+    def pending(self, actions, progress):
+        for action in actions:
+            if action.node.id in self.done:
+                progress.show_progress(action.node.name, 'resume')
+                continue
+            yield action
+
+    def record(self, action, status):
+        self.sink.push({'run': self.key, 'action': self.action, 'id': action.node.id, 'path': action.path,
+                        'status': status, 'at': datetime.now(timezone.utc).isoformat()})
+
+    def close(self):
+        self.sink.close()
@@ -0,0 +1,74 @@
+import threading
+import logging
+import time
+import os
+from blobcache import load_yaml, dump_yaml
+
+log = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+
+
+class LanguageCache:
+    def __init__(self, path=None, expiry=30):
+        # expiry in days, 0 keeps the entries until the project changes
+        self.path = path
+        self.expiry = float(expiry) * DAY
+        self.projects = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.changed = False
+        if path and os.path.exists(path):
+            with open(path, 'r') as stream:
+                self.projects = load_yaml(stream) or {}
+            log.debug("Loaded language cache [{path}] with [{num}] projects".format(
+                path=path, num=len(self.projects)))
+
+    def is_fresh(self, entry, node):
+        if entry is None:
+            return False
+        if entry.get('last_activity_at') != getattr(node, 'last_activity_at', None):
+            return False
+        return not self.expiry or time.time() - entry['fetched_at'] < self.expiry
+
+    def get(self, node):
+        with self.lock:
+            entry = self.projects.get(node.id)
+            if self.is_fresh(entry, node):
+                self.hits += 1
+                return entry['languages']
+            self.misses += 1
+            return None
+
+    def put(self, node, languages):
+        entry = {'languages': dict(languages or {}), 'fetched_at': time.time(),
+                 'last_activity_at': getattr(node, 'last_activity_at', None)}
+        with self.lock:
+            self.projects[node.id] = entry
+            self.changed = True
+        return entry['languages']
+
+    def languages(self, node, fetch):
+        # fetch is only called on a miss, a hit costs no request
+        languages = self.get(node)
+        if languages is None:
+            languages = self.put(node, fetch())
+        return languages
+
+    def is_cached(self, node):
+        with self.lock:
+            return self.is_fresh(self.projects.get(node.id), node)
+
+    def save(self):
+        if not self.path or not self.changed:
+            return
+        with self.lock:
+            text = dump_yaml(self.projects)
+            self.changed = False
+        tmp = "{}.tmp".format(self.path)
+        with open(tmp, 'w') as stream:
+            stream.write(text)
+        os.replace(tmp, self.path)
+        log.debug("Language cache [{path}] saved, [{hits}] hits and [{misses}] misses".format(
+            path=self.path, hits=self.hits, misses=self.misses))
@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta, timezone
+from gitproc import git_output
+import threading
+import logging
+import yaml
+import os
+
+log = logging.getLogger(__name__)
+
+# Gitlab moves last_activity_at at most once in this window, pushes inside it leave it as it was
+ACTIVITY_WINDOW = timedelta(hours=1)
+
+
+def has_git_dir(path):
+    return os.path.isdir(os.path.join(path, '.git'))
+
+
+def parse_time(value):
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+
+
+class Manifest:
+    def __init__(self, dest, runner):
+        self.runner = runner
+        self.path = os.path.normpath(dest) + '.manifest.yml'
+        self.projects = {}
+        self.seen = set()
+        self.stale = []
+        self.lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as stream:
+                self.projects = yaml.safe_load(stream) or {}
+            log.debug("Loaded manifest [{path}] with [{num}] projects".format(
+                path=self.path, num=len(self.projects)))
+
+    def save(self):
+        tmp = "{}.tmp".format(self.path)
+        with open(tmp, 'w') as stream:
+            yaml.safe_dump(self.projects, stream, default_flow_style=False)
+        os.replace(tmp, self.path)
+
+    def remote_head(self, action):
+        # A hung or prompting remote is killed by the runner like any other git process
+        output = self.runner.output(action.path, 'ls-remote', ['git', 'ls-remote', action.node.url, 'HEAD'])
+        return output.split()[0] if output else None
+
+    def move(self, entry, action):
+        # A renamed or transferred project keeps its checkout instead of a new clone
+        if has_git_dir(entry['path']) and not has_git_dir(action.path):
+            if os.path.isdir(action.path) and not os.listdir(action.path):
+                os.rmdir(action.path)
+            os.renames(entry['path'], action.path)
+            log.info("Moved project {id} from {old} to {new}".format(
+                id=action.node.id, old=entry['path'], new=action.path))
+            with self.lock:
+                entry['path'] = action.path
+        elif has_git_dir(entry['path']):
+            log.info("Project {id} moved to {new}, stale directory {old}".format(
+                id=action.node.id, old=entry['path'], new=action.path))
+            with self.lock:
+                self.stale.append(entry['path'])
+
+    def is_synced(self, action):
+        with self.lock:
+            self.seen.add(action.node.id)
+            entry = self.projects.get(action.node.id)
+        if entry is None:
+            return False
+        if entry['path'] != action.path:
+            self.move(entry, action)
+        if not has_git_dir(action.path):
+            return False
+        activity = getattr(action.node, 'last_activity_at', None)
+        if activity is not None and activity != entry.get('last_activity_at'):
+            return False
+        if activity is not None and self.settled(activity, entry.get('synced_at')):
+            return True
+        # Synced too soon after the last activity for it to tell, the remote head does
+        return self.remote_head(action) == entry.get('head')
+
+    def settled(self, activity, synced_at):
+        # A push after a sync this late would have moved last_activity_at
+        activity, synced_at = parse_time(activity), parse_time(synced_at)
+        return activity is not None and synced_at is not None and synced_at - activity >= ACTIVITY_WINDOW
+
+    def record(self, action):
+        try:
+            head = git_output(action.path, 'rev-parse', 'HEAD').strip()
+        except Exception:
+            return
+        entry = {'path': action.path, 'url': action.node.url, 'head': head,
+                 'last_activity_at': getattr(action.node, 'last_activity_at', None),
+                 'synced_at': datetime.now(timezone.utc).isoformat()}
+        with self.lock:
+            self.projects[action.node.id] = entry
+
+    def report(self):
+        for id, entry in self.projects.items():
+            if id not in self.seen and has_git_dir(entry['path']):
+                self.stale.append(entry['path'])
+                log.info("Project {id} is no longer in the tree, stale directory {path}".format(
+                    id=id, path=entry['path']))
+        return self.stale
@@ -0,0 +1,25 @@
+import globre
+import logging
+import re
+
+log = logging.getLogger(__name__)
+
+
+class Matcher:
+    def __init__(self, patterns, default=False):
+        self.patterns = patterns
+        self.default = default
+        self.regex = None
+        if patterns is not None:
+            # Every glob is compiled once into a single alternation
+            expr = "|".join("(?:{})".format(globre.compile(pattern).pattern) for pattern in patterns)
+            self.regex = re.compile("^(?:{})$".format(expr or "(?!)"))
+
+    def match(self, path):
+        if self.regex is None:
+            return self.default
+        matched = self.regex.match(path)
+        if matched:
+            log.debug("Matched patterns {patterns} in path {path}".format(
+                patterns=self.patterns, path=path))
+        return matched is not None
@@ -0,0 +1,98 @@
+import subprocess
+import logging
+import sys
+import time
+import os
+import git
+import pipeline
+from gitproc import git_output
+
+log = logging.getLogger(__name__)
+
+# Extensions of the languages the plugins care about, named as gitlab names them
+EXTENSIONS = {
+    '.java': 'Java', '.kt': 'Kotlin', '.kts': 'Kotlin', '.groovy': 'Groovy', '.gradle': 'Groovy',
+    '.scala': 'Scala', '.js': 'JavaScript', '.jsx': 'JavaScript', '.mjs': 'JavaScript',
+    '.ts': 'TypeScript', '.tsx': 'TypeScript', '.vue': 'Vue', '.py': 'Python', '.go': 'Go',
+    '.rb': 'Ruby', '.php': 'PHP', '.cs': 'C#', '.c': 'C', '.h': 'C', '.cpp': 'C++', '.cc': 'C++',
+    '.hpp': 'C++', '.swift': 'Swift', '.rs': 'Rust', '.dart': 'Dart', '.sh': 'Shell',
+    '.html': 'HTML', '.css': 'CSS', '.scss': 'SCSS', '.sql': 'PLSQL', '.dockerfile': 'Dockerfile',
+}
+
+def resolve_ref(path, branch):
+    # A mirror only updates the remote tracking branch on fetch
+    for ref in ('origin/{}'.format(branch), branch):
+        try:
+            git_output(path, 'rev-parse', '--verify', '--quiet', '{}^{{commit}}'.format(ref))
+            return ref
+        except subprocess.CalledProcessError:
+            continue
+    return None
+
+
+def ci_blob(path, ref):
+    # A checkout without the file is missing it, only other failures of git are errors
+    try:
+        return git_output(path, 'rev-parse', '--verify', '--quiet', '{ref}:{file}'.format(ref=ref, file=git.CI_FILE)).strip()
+    except subprocess.CalledProcessError as e:
+        if e.returncode == 1:
+            return None
+        raise
+
+
+def languages(path, ref):
+    # Files are counted, not sized, sizes would fetch every blob a partial clone left on the remote
+    counts = {}
+    for name in git_output(path, 'ls-tree', '-r', '--name-only', ref).splitlines():
+        lang = EXTENSIONS.get(os.path.splitext(name)[1].lower())
+        if lang is not None:
+            counts[lang] = counts.get(lang, 0) + 1
+    total = sum(counts.values())
+    # Same shape as project.languages(), biggest share first
+    return {lang: round(100.0 * count / total, 2)
+            for lang, count in sorted(counts.items(), key=lambda item: item[1], reverse=True)}
+
+
+def audit_project(path, branch):
+    # Runs in a worker process, only plain data goes back to the parent
+    ref = resolve_ref(path, branch)
+    blob_id = None if ref is None else ci_blob(path, ref)
+    if blob_id is None:
+        return None
+    text = lambda: git_output(path, 'cat-file', 'blob', blob_id)
+    yaml_data = pipeline.blob_cache.document(blob_id, text)
+    try:
+        lang = git.lang_from(languages(path, ref), yaml_data)
+    except:
+        lang = None
+        log.info(sys.exc_info())
+    return lang, git.render_plugins(pipeline.blob_cache, blob_id, text, lang)
+
+
+def mirrored(actions):
+    for action in actions:
+        if not git.is_gitlab_project(action.node):
+            continue
+        if git.is_git_repo(action.path):
+            action.started = time.monotonic()
+            yield action
+        else:
+            log.info("Project {} is not mirrored, run clone first".format(action.path))
+
+
+def sync_plugins_offline(actions, arguments):
+    branch = arguments["--name"]
+    window = 2 * (os.cpu_count() or 1)
+    with pipeline.process_pool(arguments) as executor:
+        submit = lambda action: executor.submit(audit_project, action.path, branch)
+        for action, result, error in pipeline.bounded(mirrored(actions), submit, window):
+            git.progress.show_progress(action.node.name, 'plugins')
+            if error is not None:
+                pipeline.report_error(action, 'plugins', error)
+                continue
+            if result is None:
+                git.report_missing(action, branch)
+                continue
+            lang, dump_file = result
+            git.print_plugins(action, action.node.name, lang, dump_file)
+            git.finish(action, 'ok')
@@ -1,9 +1,12 @@
 """Gitlab .
 
 Usage:
-  pipeline-revision.py [options] branch ( --list | (--create --name=<branch_name> --ref=<branch_ref>) | --remove --name=<branch_name>)
+  pipeline-revision.py [options] branch ( (--list [--search=<pattern>]) | (--create --name=<branch_name> --ref=<branch_ref>) | --remove --name=<branch_name>)
   pipeline-revision.py [options] clone <path>
-  pipeline-revision.py [options] plugins ((--list --name=<branch_name>) | (--check --name=<branch_name>) | (--push --name=<branch_name>)) [--sast | --dependency-check | --detect-secrets | --add-veracode] [ --recursive ]
+  pipeline-revision.py merge <output> <inputs>...
+  pipeline-revision.py [options] index <database> --name=<branch_name>
+  pipeline-revision.py query <database> [--job=<job> [--missing]] [--image=<image>] [--template=<template>] [--include-file=<file>] [--include-project=<project>] [--at=<ref>] [--lang=<lang>] [--sql=<sql>]
+  pipeline-revision.py [options] plugins ((--list --name=<branch_name>) | (--check --name=<branch_name>) | (--push --name=<branch_name> [--ref=<branch_ref>])) [--sast | --dependency-check | --detect-secrets | --add-veracode] [ --recursive ] [<path>]
 
 Options:
   -h --help                  Show this screen.
@@ -13,13 +16,49 @@ Options:
   -i --include=<csv>         Included files in a comma separated string or csv path. [default: 1c].
   -e --exclude=<csv>         Excluded files in a comma separated string or csv path. [default: 1c].
   -c --concurrency=<number of workers>      Number of workers[default: 1].
-  -f --file=<file>           File previous input, this should be yaml format
-  --format=<format>          Format of the output {yaml, json, tree} [default: yaml].
+  -f --file=<file>           File previous input, yaml or json, one node per line when it ends in .jsonl
+  --flat                     Load the tree from one listing of groups and one of projects
+  --cache=<file>             Snapshot of the tree, refreshed with the changes since it was taken
+  --compact                  Keep the tree in compact arrays, for very large instances
+  --format=<format>          Format of the output {yaml, json, jsonl, tree} [default: yaml].
   -m --method=<method>       Method of clone {ssh, http} [default: http]
+  --clone-strategy=<strategy>  Clone {full, shallow, blobless, treeless, sparse}, pulls follow it [default: full]
+  --depth=<depth>            History kept by the shallow strategy [default: 1]
+  --sparse-paths=<csl>       Paths checked out by the sparse strategy [default: /.gitlab-ci.yml]
+  --git-concurrency=<number>  git processes running at once, apart from --concurrency [default: 4]
+  --git-timeout=<seconds>    Seconds before a clone or pull is killed [default: 600]
+  --git-retries=<number>     Retries of a failed clone or pull [default: 1]
+  --git-report=<file>        CSV with the duration and status of every clone or pull
   --dry-run                  
-  -r --recursive            Recursive pipeline inspector
-  -o --output=<output>      Output CSV File
-  --throttle=<time>      throttle [default: 360]
+  -r --recursive            Recursive pipeline inspector, follows every include of the CI file
+  -o --output=<output>      Output file of the results, gzip compressed when it ends in .gz
+  --output-format=<format>  Format of the output file {csv, jsonl} [default: csv]
+  --journal=<file>          Append the outcome of every project to this file
+  --resume                  Skip the projects the journal has as done by the same work, retry the rest
+  --job=<job>               Query projects with a job named like the pattern, without it with --missing
+  --image=<image>           Query projects with a job running on an image like the pattern
+  --template=<template>     Query projects including a gitlab template like the pattern
+  --include-file=<file>     Query projects including a file like the pattern, also through other includes
+  --include-project=<project>  Query projects including files of a project like the pattern
+  --at=<ref>                Ref of the included files of the query
+  --lang=<lang>             Query projects of a language
+  --sql=<sql>               Any read only query over the index
+  --shard=<i/N>             Only the i-th of N slices of the projects, split by project id, for N machines or jobs
+  --throttle=<rpm>          Requests per minute until gitlab sends its rate limit, 0 to wait for it [default: 0]
+  --retries=<number>        Retries of a failed gitlab request, python-gitlab retries a last 429 on its own [default: 3]
+  --backoff=<seconds>       Base of the jittered exponential backoff between retries [default: 0.5]
+  --timeout=<seconds>       Timeout of each gitlab request [default: 30]
+  --engine=<engine>         Engine of the plugins and branch actions {threads, async} [default: threads]
+  --in-flight=<number>      Requests in flight with the async engine [default: 100]
+  --graphql                 Fetch CI files and languages of the plugins action, or check branches, in GraphQL batches
+  --search=<pattern>        Branches listed, filtered by gitlab, ^ and $ anchor the pattern
+  --batch=<number>          Projects per GraphQL batch, at most 100 [default: 50]
+  --blob-cache=<dir>        Directory keeping parsed CI files by blob sha between runs
+  --blob-cache-size=<number>  CI files kept in memory by blob sha [default: 1024]
+  --lang-cache=<file>       Languages of every project, kept until the project changes or they expire
+  --lang-expiry=<days>      Days a cached language is trusted, 0 for no expiry [default: 30]
+  --lang-refresh            Fill the language cache in GraphQL batches before the plugins action
+  --offline                 Audit plugins from the checkouts under <path> left by clone, without the API
 """
 from docopt import docopt
 import logging
@@ -28,7 +67,14 @@ from tree import Tree
 import sys
 import os
 import csv
-from gitlab import Gitlab
+from gitlab import Gitlab, GitlabAuthenticationError
+from transport import make_session
+from scheduler import RateScheduler
+from blobcache import BlobCache
+from includes import IncludeResolver
+from langcache import LanguageCache
+from shard import Shard, merge
+from index import print_query
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 log = logging.getLogger(__name__)
@@ -58,17 +104,49 @@ def exclude_paths(path):
         log.debug("Error trying to openning the file input")
     return excludes
 
-def auth_gitlab(url, token):
+def auth_gitlab(url, token, arguments):
     try:
         log.debug("Loading credentials")
-        gitlab = Gitlab(url, private_token=token)
+        session = make_session(int(arguments["--concurrency"]), arguments["scheduler"], retries=int(arguments["--retries"]),
+                               backoff=float(arguments["--backoff"]))
+        gitlab = Gitlab(url, private_token=token, session=session,
+                        timeout=float(arguments["--timeout"]))
         return gitlab
     except GitlabAuthenticationError:
         log.fatal("[Invalid credentials]: {}".format(sys.exc_info()))
         sys.exit(1)
 
+def setup(arguments, url, token):
+    # Shared state of a run, kept in arguments for every action to reach
+    arguments["scheduler"] = RateScheduler(int(arguments["--throttle"]))
+    arguments["blob_cache"] = BlobCache(int(arguments["--blob-cache-size"]), arguments["--blob-cache"])
+    gitlab = auth_gitlab(url, token, arguments)
+    arguments["gitlab"]  = gitlab
+    arguments["include_resolver"] = IncludeResolver(gitlab, arguments["blob_cache"])
+    arguments["lang_cache"] = LanguageCache(arguments["--lang-cache"], float(arguments["--lang-expiry"]))
+    arguments["token"]  = token
+    arguments["url_base"]  = url
+    return gitlab
+
 if __name__ == '__main__':
     arguments = docopt(__doc__, version='revisor v 0.0.1')
+    if arguments["query"]:
+        # Answered from the index alone
+        print_query(arguments)
+        sys.exit(0)
+    if arguments["merge"]:
+        # Results or journals of every shard into one file, no gitlab involved
+        merge(arguments["<output>"], arguments["<inputs>"])
+        sys.exit(0)
+    if arguments["--shard"] is not None:
+        try:
+            arguments["shard"] = Shard.parse(arguments["--shard"])
+        except ValueError as e:
+            log.fatal(e)
+            sys.exit(1)
+    if arguments["--resume"] and arguments["--journal"] is None:
+        log.fatal("--resume needs the --journal of the run to resume")
+        sys.exit(1)
     # print(arguments)
     in_file = arguments["--file"]
     ipattern= []
@@ -78,12 +156,10 @@ if __name__ == '__main__':
     url = os.environ.get('GITLAB_URL', arguments["--gitlab"])
     token = os.environ.get('GITLAB_TOKEN', arguments["--token"])
     
-    gitlab = auth_gitlab(url, token)
-    arguments["gitlab"]  = gitlab
-    arguments["token"]  = token
-    arguments["url_base"]  = url
+    gitlab = setup(arguments, url, token)
     tree = Tree(url, gitlab, includes=ipattern, excludes=opattern, concurrency=int(
-        arguments["--concurrency"]), in_file=in_file, method=arguments["--method"])
+        arguments["--concurrency"]), in_file=in_file, method=arguments["--method"],
+        flat=arguments["--flat"], cache=arguments["--cache"], compact=arguments["--compact"])
     log.debug("Reading projects tree from gitlab at [{url}]".format(
         url=url))
     tree.load_tree()
@@ -100,3 +176,5 @@ if __name__ == '__main__':
             tree.sync_tree("clone", arguments)
         if arguments["plugins"]:
             tree.sync_tree("plugins", arguments)
+        if arguments["index"]:
+            tree.sync_tree("index", arguments)
@@ -0,0 +1,201 @@
+from collections import deque
+import concurrent.futures
+import multiprocessing
+import logging
+import time
+import sys
+import os
+from gitlab import GitlabGetError
+import git
+from blobcache import BlobCache
+
+log = logging.getLogger(__name__)
+
+blob_cache = None
+# Handlers of sync_threads answer True when done, False when they gave up and None when there was nothing to do
+OUTCOMES = {True: 'ok', False: 'error', None: 'skip'}
+
+
+def init_worker(size, path):
+    # Every worker process keeps its own cache, --blob-cache shares it through disk
+    global blob_cache
+    blob_cache = BlobCache(size, path)
+
+
+def process_pool(arguments):
+    # The pool starts next to running I/O and writer threads, a fork would copy their held locks
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return concurrent.futures.ProcessPoolExecutor(
+        mp_context=multiprocessing.get_context(method), initializer=init_worker,
+        initargs=(int(arguments["--blob-cache-size"]), arguments["--blob-cache"]))
+
+
+def done(result):
+    future = concurrent.futures.Future()
+    future.set_result(result)
+    return future
+
+
+def lazy_text(file_object):
+    # Decoded once, and only when something needs the text
+    decoded = []
+
+    def text():
+        if not decoded:
+            decoded.append(file_object.decode().decode('utf-8'))
+        return decoded[0]
+    return text
+
+
+def cached_plugins(blob_cache, blob_id, lang_dict):
+    # A blob already rendered for its language needs no decode, parse, transform or dump
+    if lang_dict:
+        lang = git.lang_from(lang_dict, None)
+    else:
+        document = blob_cache.get(('doc', blob_id))
+        if document is None:
+            return None
+        try:
+            lang = git.lang_from(lang_dict, document)
+        except Exception:
+            # The transform stage logs it like any other project
+            return None
+    dump_file = blob_cache.get(('dump', blob_id, lang))
+    return None if dump_file is None else (lang, dump_file)
+
+
+def outcome(item, future):
+    try:
+        return item, future.result(), None
+    except Exception as e:
+        return item, None, e
+
+
+def bounded(items, submit, window):
+    # At most window futures are pending, the next item is only pulled when the
+    # oldest one is consumed, so a slow consumer holds back every stage before it
+    pending = deque()
+    try:
+        for item in items:
+            pending.append((item, submit(item)))
+            if len(pending) >= window:
+                yield outcome(*pending.popleft())
+        while pending:
+            yield outcome(*pending.popleft())
+    finally:
+        # An interrupted run drops whatever has not started yet
+        for _, future in pending:
+            future.cancel()
+
+
+def fetch_plugins(action):
+    # I/O stage, runs in a thread
+    action.started = time.monotonic()
+    project = action.arguments["gitlab"].projects.get(action.node.id, lazy=True)
+    try:
+        file_object = git.get_ci_file(project, action)
+    except GitlabGetError as e:
+        if e.response_code != 404:
+            raise
+        return None
+    languages = action.arguments["lang_cache"].languages(action.node, project.languages)
+    text = lazy_text(file_object)
+    nodes = None
+    if action.arguments["--recursive"]:
+        # Includes are fetched here with the other requests, the consumer only prints them
+        document = action.arguments["blob_cache"].document(file_object.blob_id, text)
+        nodes = action.arguments["include_resolver"].resolve(document, action.node.id, action.arguments["--name"])
+    cached = cached_plugins(action.arguments["blob_cache"], file_object.blob_id, languages)
+    return file_object.blob_id, text, languages, nodes, cached
+
+
+def transform_submit(cpu_pool, item):
+    blob_id, text, languages, _, cached = item[1]
+    if cached is not None:
+        return done(cached)
+    return cpu_pool.submit(transform_plugins, blob_id, text(), languages)
+
+
+def transform_plugins(blob_id, text, lang_dict):
+    # CPU stage, runs in a worker process
+    yaml_data = blob_cache.document(blob_id, lambda: text)
+    try:
+        lang = git.lang_from(lang_dict, yaml_data)
+    except:
+        lang = None
+        log.info(sys.exc_info())
+    return lang, git.render_plugins(blob_cache, blob_id, lambda: text, lang)
+
+
+def push_plugins(action, lang, blob_id, text, dump_file):
+    # Writes go back to the I/O threads, the consumer keeps reading results
+    git.push_plugins(action, action.node.name, lang, blob_id, text, dump_file)
+
+
+def report_error(action, step, error):
+    log.info("Error in {step} of {path}: {error}".format(step=step, path=action.path, error=error))
+    git.record_result(action, action.node.name, None, step, 'error')
+    git.finish(action, 'error')
+
+
+def succeeded(results, step):
+    # Projects without the CI file stop here, like the other engines
+    for item in results:
+        if item[2] is None and item[1] is not None:
+            yield item
+        elif item[2] is None:
+            git.progress.show_progress(item[0].node.name, 'plugins')
+            git.report_missing(item[0], item[0].arguments["--name"])
+        else:
+            git.progress.show_progress(item[0].node.name, step)
+            report_error(item[0], step, item[2])
+
+
+def review_plugins(transformed, arguments):
+    # Output stage, in the calling thread, yields what is left to push
+    for (action, (blob_id, text, _, nodes, _), _), result, error in transformed:
+        git.progress.show_progress(action.node.name, 'plugins')
+        if error is not None:
+            report_error(action, 'transform', error)
+            continue
+        lang, dump_file = result
+        # Workers render into their own caches, the next project with this blob is a hit here
+        arguments["blob_cache"].remember(('dump', blob_id, lang), dump_file)
+        git.print_plugins(action, action.node.name, lang, dump_file)
+        if nodes is not None:
+            git.print_include_nodes(nodes)
+        if git.is_push(arguments):
+            yield action, lang, blob_id, text, dump_file
+        else:
+            git.finish(action, 'ok')
+
+
+def sync_plugins(actions, arguments):
+    workers = int(arguments["--concurrency"])
+    projects = (action for action in actions if git.is_gitlab_project(action.node))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as io_pool, process_pool(arguments) as cpu_pool:
+        fetched = bounded(projects, lambda action: io_pool.submit(fetch_plugins, action), 2 * workers)
+        transformed = bounded(succeeded(fetched, 'fetch'), lambda item: transform_submit(cpu_pool, item),
+                              2 * (os.cpu_count() or 1))
+        pushed = bounded(review_plugins(transformed, arguments), lambda item: io_pool.submit(push_plugins, *item),
+                         2 * workers)
+        for item, _, error in pushed:
+            if error is not None:
+                report_error(item[0], 'push', error)
+
+
+def sync_threads(actions, handler, arguments, step, interrupt=None, workers=None):
+    # A handler returning False failed without raising, like a git process that gave up
+    workers = int(arguments["--concurrency"]) if workers is None else workers
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for action, result, error in bounded(actions, lambda action: executor.submit(handler, action), 2 * workers):
+                if error is not None:
+                    report_error(action, step, error)
+                else:
+                    git.finish(action, OUTCOMES[result])
+        except KeyboardInterrupt:
+            # Work already running is stopped, instead of waited for
+            if interrupt is not None:
+                interrupt()
+            raise
@@ -1,4 +1,5 @@
 from tqdm import tqdm
+import threading
 import time
 
 
@@ -8,6 +9,7 @@ class ProgressBar:
         self.description = description
         self.disabled = disabled
         self.start = None
+        self.lock = threading.Lock()
 
     def init_progress(self, total):
         if self.progress is None:
@@ -17,14 +19,16 @@ class ProgressBar:
 
     def update_progress_length(self, added):
         if self.progress is not None:
-            self.progress.total = self.progress.total + added
-            self.progress.refresh()
+            with self.lock:
+                self.progress.total = self.progress.total + added
+                self.progress.refresh()
 
     def show_progress(self, text, category='~'):
         if self.progress is not None:
-            self.progress.update(1)
-            postfix = {category : text}
-            self.progress.set_postfix(postfix)
+            with self.lock:
+                self.progress.update(1)
+                postfix = {category : text}
+                self.progress.set_postfix(postfix)
 
     def finish_progress(self):
         if self.progress is not None:
@@ -0,0 +1,61 @@
+import threading
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+
+class RateScheduler:
+    def __init__(self, per_minute=0):
+        self.lock = threading.Lock()
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self.next_slot = time.monotonic()
+        self.paused_until = 0.0
+
+    def reserve(self):
+        # Reserve the next free slot, the caller waits the returned delay outside of the lock
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot, self.paused_until)
+            self.next_slot = slot + self.interval
+        return slot - now
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def observe(self, status, headers):
+        now = time.monotonic()
+        with self.lock:
+            retry_after = headers.get('Retry-After')
+            if status == 429 and retry_after is not None:
+                self.pause(now + self.seconds(retry_after, 1.0))
+            # Without these headers, as on many self-hosted instances, requests are only paced by --throttle
+            remaining = self.count(headers.get('RateLimit-Remaining'))
+            reset = headers.get('RateLimit-Reset')
+            if remaining is None or reset is None:
+                return
+            window = max(self.seconds(reset, 0.0) - time.time(), 0.0)
+            if remaining <= 0:
+                self.pause(now + window)
+            else:
+                # Spread what is left of the budget evenly until the window resets
+                self.interval = window / remaining
+
+    def pause(self, until):
+        if until > self.paused_until:
+            log.debug("Rate limited, pausing requests for [{:.2f}]s".format(until - time.monotonic()))
+            self.paused_until = until
+
+    def seconds(self, value, default):
+        try:
+            return float(value)
+        except ValueError:
+            return default
+
+    def count(self, value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
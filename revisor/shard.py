@@ -0,0 +1,86 @@
+from collections import Counter
+import logging
+import json
+import zlib
+import csv
+import re
+from sink import FIELDS, open_text
+
+log = logging.getLogger(__name__)
+
+SHARD = re.compile(r'^(\d+)/(\d+)$')
+SUFFIXES = ('.gz', '.csv', '.jsonl', '.json')
+
+
+class Shard:
+    def __init__(self, index, total):
+        self.index = index
+        self.total = total
+
+    @classmethod
+    def parse(cls, text):
+        # i/N counts from 1, like CI_NODE_INDEX/CI_NODE_TOTAL of parallel jobs
+        match = SHARD.match(text or "")
+        if match is None or not 1 <= int(match.group(1)) <= int(match.group(2)):
+            raise ValueError("Invalid shard [{}], expected i/N with 1 <= i <= N".format(text))
+        return cls(int(match.group(1)), int(match.group(2)))
+
+    def owns(self, node):
+        # Same split on every machine and every run, whatever the order of the tree
+        key = str(node.id) if node.id > 0 else node.root_path
+        return zlib.crc32(key.encode('utf-8')) % self.total == self.index - 1
+
+    def select(self, actions):
+        for action in actions:
+            if self.owns(action.node):
+                yield action
+
+    def path(self, path):
+        # results.csv.gz becomes results.2-of-4.csv.gz
+        stem, suffix = path, ""
+        while stem.endswith(SUFFIXES):
+            stem, dot, extension = stem.rpartition('.')
+            suffix = dot + extension + suffix
+        return "{stem}.{index}-of-{total}{suffix}".format(stem=stem, index=self.index, total=self.total,
+                                                          suffix=suffix)
+
+
+def is_jsonl(path):
+    return '.json' in path
+
+
+def read_records(path):
+    # Journals and jsonl results have one object per line, anything else is a csv row
+    with open_text(path, 'r') as stream:
+        for line in stream:
+            if line.startswith('{'):
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    log.debug("Skipping broken line in [{}]".format(path))
+            elif line.strip():
+                yield next(csv.reader([line], delimiter=','))
+
+
+def as_dict(record):
+    return record if isinstance(record, dict) else dict(zip(FIELDS, record))
+
+
+def merge(output, inputs):
+    # Shards own disjoint projects, so merging is a concatenation in input order,
+    # csv results and jsonl results or journals, the output follows its extension
+    statuses = Counter()
+    with open_text(output, 'w') as stream:
+        writer = None if is_jsonl(output) else csv.writer(stream, delimiter=',')
+        for path in inputs:
+            for record in read_records(path):
+                record = as_dict(record)
+                if writer is None:
+                    stream.write(json.dumps(record) + "\n")
+                else:
+                    writer.writerow([record.get(field) for field in FIELDS])
+                statuses[record.get('status')] += 1
+    log.info("Merged [{num}] files into [{output}]: {statuses}".format(
+        num=len(inputs), output=output,
+        statuses=", ".join("{} {}".format(count, status) for status, count in sorted(statuses.items(), key=str))))
+    return statuses
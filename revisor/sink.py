@@ -0,0 +1,86 @@
+import threading
+import logging
+import queue
+import gzip
+import json
+import csv
+
+log = logging.getLogger(__name__)
+
+FIELDS = ['project', 'url', 'lang', 'step', 'status', 'seconds']
+CLOSE = object()
+# Seconds a blocked push waits before looking again whether the writer is still alive
+PUT_TIMEOUT = 1.0
+
+
+def open_text(path, mode):
+    # Every append to a .gz file adds a gzip member, reading goes through all of them
+    if path.endswith('.gz'):
+        return gzip.open(path, mode=mode + 't', newline='')
+    return open(path, newline='', mode=mode)
+
+
+class ResultSink:
+    def __init__(self, path, format='csv', batch=500, queue_size=10000):
+        self.path = path
+        self.format = format
+        self.batch = batch
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self.run, name='result-sink', daemon=True)
+        self.written = 0
+        self.error = None
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def push(self, record):
+        # Blocks when the writer falls behind, instead of growing without bound,
+        # a writer that died raises its error here instead of leaving the queue full
+        while True:
+            self.check()
+            try:
+                self.queue.put(record, timeout=PUT_TIMEOUT)
+                return
+            except queue.Full:
+                continue
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        self.push(CLOSE)
+        self.thread.join()
+        self.check()
+        log.debug("Wrote [{num}] results to [{path}]".format(num=self.written, path=self.path))
+
+    def run(self):
+        try:
+            self.write_loop()
+        except Exception as e:
+            log.error("Error writing results to [{path}]: {error}".format(path=self.path, error=e))
+            self.error = e
+
+    def write_loop(self):
+        with open_text(self.path, 'a') as stream:
+            if self.format == 'jsonl':
+                write = lambda record: stream.write(json.dumps(record) + "\n")
+            else:
+                writer = csv.writer(stream, delimiter=',')
+                write = lambda record: writer.writerow([record.get(field) for field in FIELDS])
+            closed = False
+            while not closed:
+                batch = [self.queue.get()]
+                while len(batch) < self.batch:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                for record in batch:
+                    if record is CLOSE:
+                        closed = True
+                        continue
+                    write(record)
+                    self.written += 1
+                stream.flush()
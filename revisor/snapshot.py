@@ -0,0 +1,53 @@
+from datetime import datetime, timezone
+import yaml
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+
+class Snapshot:
+    def __init__(self, path):
+        self.path = path
+        self.taken_at = None
+        self.groups = []
+        self.projects = {}
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        with open(self.path, 'r') as stream:
+            dct = yaml.safe_load(stream)
+        if any('namespace_id' not in project for project in dct["projects"]):
+            # Older snapshots keep namespaces by path, they are taken again
+            log.debug("Snapshot [{}] has no namespace ids, taking a new one".format(self.path))
+            return False
+        self.taken_at = dct["taken_at"]
+        self.groups = dct["groups"]
+        self.projects = {project['id']: project for project in dct["projects"]}
+        log.debug("Loaded snapshot [{path}] taken at [{taken_at}] with [{num}] projects".format(
+            path=self.path, taken_at=self.taken_at, num=len(self.projects)))
+        return True
+
+    def save(self):
+        dct = {'taken_at': self.taken_at, 'groups': self.groups,
+               'projects': list(self.projects.values())}
+        tmp = "{}.tmp".format(self.path)
+        with open(tmp, 'w') as stream:
+            yaml.safe_dump(dct, stream, default_flow_style=False, sort_keys=False)
+        os.replace(tmp, self.path)
+
+    def now(self):
+        return datetime.now(timezone.utc).isoformat()
+
+    def update(self, groups, projects):
+        self.groups = groups
+        for project in projects:
+            self.projects[project['id']] = project
+
+    def prune(self, ids):
+        deleted = [id for id in self.projects if id not in ids]
+        for id in deleted:
+            del self.projects[id]
+        return deleted
@@ -0,0 +1,59 @@
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import requests
+import random
+import logging
+import gitlab
+
+log = logging.getLogger(__name__)
+
+# 429 is left to the scheduler, which pauses every worker and not only the one that got it
+RETRY_STATUS = (500, 502, 503, 504)
+# python-gitlab pages lazily with as_list=False up to 3.6 and with iterator=True since 3.7,
+# the other spelling is only a query parameter gitlab ignores, so a listing would stop at the first page
+LAZY = {'iterator': True} if tuple(int(part) for part in gitlab.__version__.split('.')[:2]) >= (3, 7) \
+    else {'as_list': False}
+
+
+def list_all(manager, **kwargs):
+    # Every page of the listing, fetched as it is iterated
+    return manager.list(**dict(kwargs, **LAZY))
+
+
+class JitteredRetry(Retry):
+    def get_backoff_time(self):
+        # Full jitter, so workers that failed together do not retry together
+        return random.uniform(0, super().get_backoff_time())
+
+
+# A 429 still there after the retries goes back to python-gitlab, which obeys it with up to ten retries
+# of its own, paced by the same scheduler, GraphQL requests only get the retries here
+class ScheduledAdapter(HTTPAdapter):
+    def __init__(self, scheduler, retries, *args, **kwargs):
+        self.scheduler = scheduler
+        self.retries = retries
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        for attempt in range(self.retries + 1):
+            self.scheduler.acquire()
+            response = super().send(request, **kwargs)
+            self.scheduler.observe(response.status_code, response.headers)
+            if response.status_code != 429 or attempt == self.retries:
+                return response
+            response.close()
+
+
+def make_session(pool_size, scheduler, retries=3, backoff=0.5):
+    retry = JitteredRetry(total=retries, connect=retries, read=retries, status=retries,
+                          backoff_factor=backoff, status_forcelist=RETRY_STATUS,
+                          raise_on_status=False, respect_retry_after_header=True)
+    # Blocking pool, extra workers wait for a connection instead of opening and dropping one
+    adapter = ScheduledAdapter(scheduler, retries, pool_maxsize=pool_size, pool_block=True,
+                               max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    log.debug("HTTP session with [{pool}] connections and [{retries}] retries".format(
+        pool=pool_size, retries=retries))
+    return session
@@ -1,121 +1,254 @@
-from anytree import Node, RenderTree, search
-from anytree.exporter import DictExporter, JsonExporter
-from anytree.importer import DictImporter
+from anytree import Node, AnyNode, RenderTree
 from git import sync_action
 from progress import ProgressBar
-import yaml
-import globre
+from snapshot import Snapshot
+from matcher import Matcher
+from compact import CompactTree, CompactNode
+from transport import list_all
+import treeio
 import logging
+import sys
 import os
+import concurrent.futures
 
 log = logging.getLogger(__name__)
 
 
 class Tree:
-    def __init__(self, url, gitlab, includes=[], excludes=[], concurrency=1, in_file=None, method="http"):
+    def __init__(self, url, gitlab, includes=[], excludes=[], concurrency=1, in_file=None, method="http", flat=False, cache=None, compact=False):
         self.in_file = in_file
+        self.compact = compact
+        self.flat = flat
+        self.cache = cache
         self.method = method
         self.concurrency = concurrency
         self.excludes = excludes
         self.includes = includes
+        self.include_matcher = Matcher(includes, default=True)
+        self.exclude_matcher = Matcher(excludes)
         self.url = url
         self.gitlab = gitlab
-        self.root = Node("", root_path="", url=url)
+        self.root = CompactNode(CompactTree(url), 0) if compact else Node("", root_path="", url=url)
         self.disable_progress = False
         self.progress = ProgressBar('* loading tree', self.disable_progress)
 
 # assert start
     def is_empty(self):
-        return self.root.height < 1
+        return not self.root.children
+
+    def count(self):
+        # Projects and groups below the root
+        if self.compact:
+            leaves, descendants = self.root.tree.count()
+        else:
+            leaves, descendants = len(self.root.leaves), len(self.root.descendants)
+        return leaves, descendants - leaves
 
     def is_included(self, node):
-        Flag = True
-        if self.includes is not None:
-            Flag = self.match_pattern(self.includes, node.root_path)
-        return Flag
+        return self.include_matcher.match(node.root_path)
 
     def is_excluded(self, node):
-        Flag = False
-        if self.excludes is not None:
-            Flag = self.match_pattern(self.excludes, node.root_path)
-        return Flag
-
-    def match_pattern(self,collection , context):
-        for pattern in collection:
-            if globre.match(pattern, context):
-                log.debug(
-                    "Matched pattern {pattern} in path {path}".format(
-                        pattern=pattern, path=context)
-                )
-                return True
+        return self.exclude_matcher.match(node.root_path)
+
+    def prune(self, node):
+        # Same rules as filter_tree, applied while crawling so pruned groups are never fetched
+        if self.is_excluded(node):
+            node.parent = None
+            return True
+        if not self.is_included(node):
+            node.path[1].parent = None
+            return True
         return False
 
     def filter_tree(self, parent):
+        # Excluded nodes go away with their subtree, a node outside the
+        # includes drops the whole top level group it belongs to
         for child in parent.children:
-            if search.findall(child, filter_=lambda node: not self.is_included(node)):
-                child.parent = None
             if self.is_excluded(child):
                 child.parent = None
-            self.filter_tree(child)
+            elif not self.is_included(child) or not self.filter_tree(child):
+                if not parent.is_root:
+                    return False
+                child.parent = None
+        return True
 
     def root_path(self, node):
         return "/".join([str(n.name) for n in node.path])
 
-    def make_node(self, name, parent, url, id=-1):
-        node = Node(name=name, parent=parent, url=url, id=id)
+    def make_node(self, name, parent, url, id=-1, **kwargs):
+        if self.compact:
+            # The path is computed on demand instead of stored on every node
+            index = parent.tree.add(name, parent.index, url, id, kwargs.get('last_activity_at'))
+            return parent.view(index)
+        node = Node(name=name, parent=parent, url=url, id=id, **kwargs)
         node.root_path = self.root_path(node)
         return node
 
     def add_projects(self, parent, projects):
         for project in projects:
             project_url = project.ssh_url_to_repo if self.method == "ssh" else project.http_url_to_repo
-            node = self.make_node(project.name, parent,
-                                  url=project_url, id=project.id)
+            node = self.make_node(project.name, parent, url=project_url, id=project.id,
+                                  last_activity_at=project.last_activity_at)
             self.progress.show_progress(node.name, 'project')
+            if self.prune(node) and parent.root != self.root:
+                return
 
-    def get_projects(self, group, parent):
-        projects = group.projects.list(as_list=False)
-        self.progress.update_progress_length(len(projects))
-        self.add_projects(parent, projects)
-
-    def get_subgroups(self, group, parent):
-        subgroups = group.subgroups.list(as_list=False)
-        self.progress.update_progress_length(len(subgroups))
-        for subgroup_def in subgroups:
-            subgroup = self.gitlab.groups.get(subgroup_def.id)
-            node = self.make_node(subgroup.name, parent, url=subgroup.web_url)
-            self.progress.show_progress(node.name, 'group')
-            self.get_subgroups(subgroup, node)
-            self.get_projects(subgroup, node)
+    def fetch_group(self, group, node):
+        # Runs in a worker thread, nodes are only created by the crawler
+        if node.root != self.root:
+            return [], []
+        subgroups = list(list_all(group.subgroups))
+        projects = list(list_all(group.projects))
+        return subgroups, projects
+
+    def crawl(self, frontier):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = {executor.submit(self.fetch_group, group, node): node for group, node in frontier}
+            while pending:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    parent = pending.pop(future)
+                    subgroups, projects = future.result()
+                    if parent.root != self.root:
+                        continue
+                    self.progress.update_progress_length(len(subgroups) + len(projects))
+                    for subgroup_def in subgroups:
+                        node = self.make_node(subgroup_def.name, parent, url=subgroup_def.web_url)
+                        self.progress.show_progress(node.name, 'group')
+                        if self.prune(node):
+                            if parent.root != self.root:
+                                break
+                            continue
+                        subgroup = self.gitlab.groups.get(subgroup_def.id, lazy=True)
+                        pending[executor.submit(self.fetch_group, subgroup, node)] = node
+                    if parent.root == self.root:
+                        self.add_projects(parent, projects)
 
     def load_tree_from_gitlab(self):
-        groups = self.gitlab.groups.list(as_list=False)
+        groups = list(list_all(self.gitlab.groups))
         self.progress.init_progress(len(groups))
+        frontier = []
         for group in groups:
             if group.parent_id is None:
                 node = self.make_node(group.name, self.root, url=group.web_url)
                 self.progress.show_progress(node.name, 'group')
-                self.get_subgroups(group, node)
-                self.get_projects(group, node)
+                if not self.prune(node):
+                    frontier.append((group, node))
+        self.crawl(frontier)
         elapsed = self.progress.finish_progress()
         log.debug("Loading projects tree from gitlab took [%s]", elapsed)
 
+    def group_record(self, group):
+        return {'id': group.id, 'name': group.name, 'full_path': group.full_path, 'parent_id': group.parent_id,
+                'web_url': group.web_url}
+
+    def project_record(self, project):
+        # By id, a renamed or moved group does not bump the last activity of its projects
+        return {'id': project.id, 'name': project.name, 'namespace_id': project.namespace['id'],
+                'http_url': project.http_url_to_repo, 'ssh_url': project.ssh_url_to_repo,
+                'last_activity_at': project.last_activity_at}
+
+    def build_tree(self, groups, projects):
+        # Parents always come before their subgroups, siblings keep the listing order
+        nodes = {None: self.root}
+        for group in sorted(groups, key=lambda g: g['full_path'].count('/')):
+            parent = nodes.get(group['parent_id'])
+            if parent is None:
+                log.debug("Skipping group [{}] without a visible parent".format(group['full_path']))
+                continue
+            nodes[group['id']] = self.make_node(group['name'], parent, url=group['web_url'])
+            self.progress.show_progress(group['name'], 'group')
+        for project in projects:
+            parent = nodes.get(project['namespace_id'])
+            if parent is None or parent.is_root:
+                continue
+            project_url = project['ssh_url'] if self.method == "ssh" else project['http_url']
+            self.make_node(project['name'], parent, url=project_url, id=project['id'],
+                           last_activity_at=project['last_activity_at'])
+            self.progress.show_progress(project['name'], 'project')
+
+    def list_records(self, **kwargs):
+        groups = [self.group_record(group) for group in list_all(self.gitlab.groups, per_page=100)]
+        self.progress.init_progress(len(groups))
+        projects = [self.project_record(project) for project in list_all(self.gitlab.projects, per_page=100, **kwargs)]
+        self.progress.update_progress_length(len(projects))
+        return groups, projects
+
+    def load_tree_from_gitlab_flat(self):
+        groups, projects = self.list_records()
+        self.build_tree(groups, projects)
+        elapsed = self.progress.finish_progress()
+        log.debug("Loading flat projects tree from gitlab took [%s]", elapsed)
+
+    def refresh_snapshot(self, snapshot):
+        taken_at = snapshot.now()
+        groups, projects = self.list_records(last_activity_after=snapshot.taken_at)
+        snapshot.update(groups, projects)
+        log.debug("Refreshed [{}] projects changed since the snapshot".format(len(projects)))
+        # A single page tells whether projects were removed, the id listing is only needed then
+        # or when gitlab leaves the total out, as it does above 10k projects
+        try:
+            total = int(list_all(self.gitlab.projects, per_page=1, simple=True).total)
+        except (TypeError, ValueError):
+            total = None
+        if total != len(snapshot.projects):
+            ids = {project.id for project in list_all(self.gitlab.projects, per_page=100, simple=True)}
+            deleted = snapshot.prune(ids)
+            log.debug("Removed [{}] deleted projects from the snapshot".format(len(deleted)))
+        snapshot.taken_at = taken_at
+
+    def load_tree_from_cache(self):
+        snapshot = Snapshot(self.cache)
+        if snapshot.exists() and snapshot.load():
+            self.refresh_snapshot(snapshot)
+        else:
+            snapshot.taken_at = snapshot.now()
+            snapshot.update(*self.list_records())
+        snapshot.save()
+        self.build_tree(snapshot.groups, snapshot.projects.values())
+        elapsed = self.progress.finish_progress()
+        log.debug("Loading projects tree from cache took [%s]", elapsed)
+
+    def file_node(self, parent):
+        if not self.compact:
+            return AnyNode(parent=parent)
+        if parent is None:
+            return self.root
+        return parent.view(parent.tree.add("", parent.index, None))
+
+    def set_attribute(self, node, key, value):
+        if self.compact:
+            node.tree.set(node.index, key, value)
+        else:
+            setattr(node, key, value)
+
     def load_tree_from_file(self):
+        # Nodes are added while the file is read, .jsonl keeps one node per line
+        read = treeio.read_jsonl if self.in_file.endswith('.jsonl') else treeio.read_yaml
         with open(self.in_file, 'r') as stream:
-            dct = yaml.safe_load(stream)
-            self.root = DictImporter().import_(dct)
+            root = read(stream, self.file_node, self.set_attribute)
+        if root is None:
+            log.fatal("No tree in file [{}]".format(self.in_file))
+            sys.exit(1)
+        self.root = root
 
     def load_tree(self):
         if self.in_file:
             log.debug("Loading tree from file [{}]".format(self.in_file))
             self.load_tree_from_file()
+        elif self.cache:
+            log.debug("Loading tree from snapshot cache [{}]".format(self.cache))
+            self.load_tree_from_cache()
         else:
             log.debug(
                 "Loading projects tree gitlab server [{}]".format(self.url))
-            self.load_tree_from_gitlab()
+            if self.flat:
+                self.load_tree_from_gitlab_flat()
+            else:
+                self.load_tree_from_gitlab()
 
-        log.debug("Fetched root node with [{}] projects".format(
-            len(self.root.leaves)))
+        log.debug("Fetched root node with [{}] projects".format(self.count()[0]))
         self.filter_tree(self.root)
 
     def print_tree(self, format="yaml"):
@@ -125,6 +258,8 @@ class Tree:
             self.print_tree_yaml()
         elif format == "json":
             self.print_tree_json()
+        elif format == "jsonl":
+            self.print_tree_jsonl()
         else:
             log.fatal("Invalid print format [{}}]".format(format))
 
@@ -138,13 +273,16 @@ class Tree:
             print(line)
 
     def print_tree_yaml(self):
-        dct = DictExporter().export(self.root)
-        print(yaml.dump(dct, default_flow_style=False))
+        treeio.write_yaml(self.root, sys.stdout)
 
     def print_tree_json(self):
-        exporter = JsonExporter(indent=2, sort_keys=True)
-        print(exporter.export(self.root))
+        treeio.write_json(self.root, sys.stdout)
+        sys.stdout.write("\n")
+
+    def print_tree_jsonl(self):
+        treeio.write_jsonl(self.root, sys.stdout)
 
     def sync_tree(self, action, arguments):
-        log.debug("Going to do [ {action} ] in [ {group_num} ] groups and [ {project_num} ] projects".format(action=action, group_num=len(self.root.descendants)-len(self.root.leaves), project_num=len(self.root.leaves)))
-        sync_action(self.root, action, arguments, disable_progress=self.disable_progress)
+        project_num, group_num = self.count()
+        log.debug("Going to do [ {action} ] in [ {group_num} ] groups and [ {project_num} ] projects".format(action=action, group_num=group_num, project_num=project_num))
+        sync_action(self.root, action, arguments, disable_progress=self.disable_progress, total=project_num)
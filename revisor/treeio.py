@@ -0,0 +1,126 @@
+from compact import CompactNode
+import json
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
+CHILDREN = 'children'
+# Long values stay on one line, wherever the node ends up indented
+WIDTH = 2 ** 30
+
+
+def attributes(node):
+    # Same attributes DictExporter writes, without the children
+    if isinstance(node, CompactNode):
+        dct = {'name': node.name, 'url': node.url, 'root_path': node.root_path}
+        if not node.is_root:
+            dct['id'] = node.id
+        if node.last_activity_at is not None:
+            dct['last_activity_at'] = node.last_activity_at
+        return dct
+    return {key: value for key, value in node.__dict__.items() if not key.startswith('_')}
+
+
+def dump_scalars(dct):
+    return yaml.dump(dct, Dumper=SafeDumper, default_flow_style=False, width=WIDTH).splitlines()
+
+
+def write_yaml(node, stream, first="", rest=""):
+    # One node at a time, children come first as yaml.dump sorts the keys
+    children = node.children
+    lines = dump_scalars(attributes(node))
+    if children:
+        stream.write(first + CHILDREN + ":\n")
+        for child in children:
+            write_yaml(child, stream, rest + "- ", rest + "  ")
+        first = rest
+    for line in lines:
+        stream.write(first + line + "\n")
+        first = rest
+
+
+def write_json(node, stream, level=0):
+    indent = "  " * (level + 1)
+    children = node.children
+    items = sorted(attributes(node).items())
+    stream.write("{")
+    separator = "\n"
+    if children:
+        stream.write("{}{}{}: [".format(separator, indent, json.dumps(CHILDREN)))
+        child_separator = "\n"
+        for child in children:
+            stream.write(child_separator + indent + "  ")
+            write_json(child, stream, level + 2)
+            child_separator = ",\n"
+        stream.write("\n{}]".format(indent))
+        separator = ",\n"
+    for key, value in items:
+        stream.write("{}{}{}: {}".format(separator, indent, json.dumps(key), json.dumps(value)))
+        separator = ",\n"
+    stream.write("\n{}}}".format("  " * level) if separator != "\n" else "}")
+
+
+def write_jsonl(node, stream):
+    # One line per node in pre-order, the depth is enough to rebuild the parents
+    stack = [(node, 0)]
+    while stack:
+        node, depth = stack.pop()
+        record = attributes(node)
+        record['depth'] = depth
+        stream.write(json.dumps(record, sort_keys=True) + "\n")
+        stack.extend((child, depth + 1) for child in reversed(node.children))
+
+
+def read_jsonl(stream, make_node, set_attribute):
+    # Only the path to the current node is kept while reading
+    path = []
+    for line in stream:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        depth = record.pop('depth')
+        del path[depth:]
+        node = make_node(path[-1] if path else None)
+        for key, value in record.items():
+            set_attribute(node, key, value)
+        path.append(node)
+    return path[0] if path else None
+
+
+def scalar_value(event, resolver, constructor):
+    tag = event.tag
+    if tag is None or tag == '!':
+        tag = resolver.resolve(yaml.ScalarNode, event.value, event.implicit)
+    node = yaml.ScalarNode(tag, event.value, style=event.style)
+    return constructor.yaml_constructors[tag](constructor, node)
+
+
+def read_yaml(stream, make_node, set_attribute):
+    # Walks the parser events, every mapping becomes a node as soon as it
+    # opens since its children may come before its own attributes
+    resolver = yaml.resolver.Resolver()
+    constructor = yaml.constructor.SafeConstructor()
+    root = None
+    path = []
+    key = None
+    for event in yaml.parse(stream, Loader=SafeLoader):
+        if isinstance(event, yaml.MappingStartEvent):
+            node = make_node(path[-1] if path else None)
+            root = node if root is None else root
+            path.append(node)
+            key = None
+        elif isinstance(event, yaml.MappingEndEvent):
+            path.pop()
+            key = None
+        elif isinstance(event, yaml.SequenceEndEvent):
+            key = None
+        elif isinstance(event, yaml.ScalarEvent) and path:
+            if key is None:
+                key = event.value
+            else:
+                set_attribute(path[-1], key, scalar_value(event, resolver, constructor))
+                key = None
+    return root
@@ -0,0 +1,71 @@
+import importlib.util
+import logging
+import json
+import sys
+import os
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REVISOR = os.path.join(ROOT, 'revisor')
+sys.path[:0] = [REVISOR, os.path.join(ROOT, 'bench')]
+
+from fakegitlab import FakeGitlab, Organization
+
+
+def load_revisor():
+    # The script name has a dash, it can only be imported from its path
+    spec = importlib.util.spec_from_file_location('revisor_main', os.path.join(REVISOR, 'pipeline-revision.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    logging.getLogger().setLevel(logging.WARNING)
+    return module
+
+
+revisor = load_revisor()
+
+
+@pytest.fixture
+def org():
+    # More projects per group than a page holds, so every listing has to paginate
+    return Organization(groups=6, depth=2, projects=150, variants=4)
+
+
+@pytest.fixture
+def server(org):
+    server = FakeGitlab(org).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_arguments(server):
+    def make_arguments(*command):
+        arguments = revisor.docopt(revisor.__doc__, argv=['-g', server.url, '-t', 'test', '-c', '4',
+                                                          '--throttle', '0'] + list(command))
+        revisor.setup(arguments, server.url, 'test')
+        return arguments
+    return make_arguments
+
+
+@pytest.fixture
+def load_tree(server):
+    from progress import ProgressBar
+    from tree import Tree
+
+    def load_tree(arguments, **kwargs):
+        tree = Tree(server.url, arguments["gitlab"], includes=None, excludes=None, concurrency=4, **kwargs)
+        tree.disable_progress = True
+        tree.progress = ProgressBar('* loading tree', True)
+        tree.load_tree()
+        return tree
+    return load_tree
+
+
+@pytest.fixture
+def results():
+    # Records of a --output-format=jsonl run
+    def results(path):
+        with open(path) as stream:
+            return [json.loads(line) for line in stream]
+    return results
@@ -0,0 +1,41 @@
+import asyncio
+
+
+def plugins_check(make_arguments, load_tree, results, engine, output):
+    arguments = make_arguments('--engine={}'.format(engine), '-o', output, '--output-format=jsonl',
+                               'plugins', '--check', '--name=main')
+    load_tree(arguments).sync_tree('plugins', arguments)
+    return sorted((record['project'], record['lang'], record['status']) for record in results(output))
+
+
+def test_async_plugins_check_matches_threads(org, make_arguments, load_tree, results, tmp_path):
+    records = plugins_check(make_arguments, load_tree, results, 'async', str(tmp_path / 'async.jsonl'))
+    assert len(records) == len(org.projects)
+    assert all(status == 'ok' and lang for _, lang, status in records)
+    assert records == plugins_check(make_arguments, load_tree, results, 'threads', str(tmp_path / 'threads.jsonl'))
+
+
+def test_async_branch_list_with_search(org, make_arguments, load_tree, tmp_path, results):
+    output = str(tmp_path / 'results.jsonl')
+    arguments = make_arguments('--engine=async', '-o', output, '--output-format=jsonl',
+                               'branch', '--list', '--search=devsecops')
+    load_tree(arguments).sync_tree('branch', arguments)
+    found = {record['project'] for record in results(output) if record['status'] == 'found'}
+    assert found == {project['name'] for project in org.projects if 'devsecops' in project['branches']}
+
+
+def test_async_plugins_parse_off_the_loop(make_arguments, load_tree, monkeypatch):
+    arguments = make_arguments('--engine=async', 'plugins', '--check', '--name=main')
+    on_loop = []
+    document = arguments["blob_cache"].document
+
+    def checked(*args):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(args[0])
+        except RuntimeError:
+            pass
+        return document(*args)
+    monkeypatch.setattr(arguments["blob_cache"], 'document', checked)
+    load_tree(arguments).sync_tree('plugins', arguments)
+    assert not on_loop
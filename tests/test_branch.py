@@ -0,0 +1,19 @@
+import git
+
+
+def test_create_plans_and_creates_every_missing_branch(org, make_arguments, load_tree, capsys):
+    arguments = make_arguments('branch', '--create', '--name=devsecops', '--ref=main')
+    missing = sum('devsecops' not in project['branches'] for project in org.projects)
+    tree = load_tree(arguments)
+    tree.sync_tree('branch', arguments)
+    assert all('devsecops' in project['branches'] for project in org.projects)
+    assert capsys.readouterr().out.count('- create ') == missing
+    tree.sync_tree('branch', make_arguments('branch', '--create', '--name=devsecops', '--ref=main'))
+    assert '- create ' not in capsys.readouterr().out
+
+
+def test_list_reads_every_page(org, make_arguments, capsys):
+    arguments = make_arguments('branch', '--list')
+    org.projects[0]['branches'] += ["release-{}".format(number) for number in range(150)]
+    project = arguments["gitlab"].projects.get(org.projects[0]['id'], lazy=True)
+    assert git.list_branches(project, 'project-1', False) == len(org.projects[0]['branches'])
@@ -0,0 +1,71 @@
+import subprocess
+import threading
+from anytree import Node
+from git import GitAction, clone_project, pull_project, run_actions
+from gitproc import GitRunner
+from manifest import Manifest
+import git
+
+IDENTITY = ['-c', 'user.name=test', '-c', 'user.email=test@localhost']
+
+
+def commit(path, message):
+    subprocess.run(['git', '-C', path] + IDENTITY + ['commit', '-q', '--allow-empty', '-m', message], check=True)
+
+
+def head(path):
+    return subprocess.run(['git', '-C', path, 'rev-parse', 'HEAD'], check=True,
+                          stdout=subprocess.PIPE).stdout.decode('utf-8').strip()
+
+
+def test_shallow_pull_follows_a_moved_upstream(tmp_path):
+    origin = str(tmp_path / 'origin')
+    subprocess.run(['git', 'init', '-q', '-b', 'main', origin], check=True)
+    for message in ('one', 'two'):
+        commit(origin, message)
+    arguments = {'--clone-strategy': 'shallow', '--depth': '1', 'git_runner': GitRunner(retries=0)}
+    action = GitAction(Node('project', id=1, url='file://' + origin), str(tmp_path / 'mirror'), arguments)
+    assert clone_project(action)
+    for pushed in (1, 2):
+        for num in range(pushed):
+            commit(origin, "push {}".format(num))
+        assert pull_project(action)
+        assert head(action.path) == head(origin)
+
+
+def test_git_concurrency_is_not_capped_by_the_api_workers(tmp_path, monkeypatch):
+    # Every clone waits for the others, so it only returns when four run at once
+    barrier = threading.Barrier(4, timeout=10)
+    monkeypatch.setattr(git, 'clone_or_pull_project', lambda action: barrier.wait() is not None)
+    arguments = {'--offline': False, '--graphql': False, '--engine': 'threads', '<path>': str(tmp_path),
+                 '--concurrency': '1', '--git-concurrency': '4', '--git-timeout': '60', '--git-retries': '0',
+                 '--git-report': None}
+    actions = [GitAction(Node("project-{}".format(id), id=id), str(tmp_path / str(id)), arguments)
+               for id in range(1, 5)]
+    run_actions(actions, 'clone', arguments)
+    assert barrier.n_waiting == 0 and not barrier.broken
+
+
+def test_an_interrupted_clone_keeps_the_manifest(tmp_path, monkeypatch):
+    origin = str(tmp_path / 'origin')
+    subprocess.run(['git', 'init', '-q', '-b', 'main', origin], check=True)
+    commit(origin, 'one')
+
+    def clone_or_interrupt(action):
+        if action.node.id > 1:
+            raise KeyboardInterrupt
+        subprocess.run(['git', 'clone', '-q', origin, action.path], check=True)
+        action.arguments["manifest"].record(action)
+        return True
+    monkeypatch.setattr(git, 'clone_or_pull_project', clone_or_interrupt)
+    dest = str(tmp_path / 'checkouts')
+    arguments = {'--offline': False, '--graphql': False, '--engine': 'threads', '<path>': dest,
+                 '--concurrency': '1', '--git-concurrency': '1', '--git-timeout': '60', '--git-retries': '0',
+                 '--git-report': None}
+    actions = [GitAction(Node("project-{}".format(id), id=id, url=origin), "{}/{}".format(dest, id), arguments)
+               for id in (1, 2)]
+    try:
+        run_actions(actions, 'clone', arguments)
+    except KeyboardInterrupt:
+        pass
+    assert list(Manifest(dest, GitRunner()).projects) == [1]
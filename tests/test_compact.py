@@ -0,0 +1,58 @@
+from anytree import Node
+from compact import CompactTree, CompactNode
+
+
+def shape(root):
+    # Pre-order paths and ids, the same for both stores
+    return [(node.root_path, getattr(node, 'id', -1), node.is_leaf, node.depth) for node in (root,) + tuple(root.descendants)]
+
+
+def build(compact):
+    root = CompactNode(CompactTree('url'), 0) if compact else Node("", root_path="", url='url', id=-1)
+
+    def add(name, parent, id=-1):
+        if compact:
+            return parent.view(parent.tree.add(name, parent.index, 'url', id))
+        node = Node(name, parent=parent, url='url', id=id)
+        node.root_path = "/".join(n.name for n in node.path)
+        return node
+    a = add('a', root)
+    b = add('b', a)
+    for id in (1, 2, 3):
+        add('p{}'.format(id), b, id)
+    add('p4', a, 4)
+    add('c', root)
+    return root
+
+
+def test_compact_nodes_behave_like_anytree():
+    compact, tree = build(True), build(False)
+    assert shape(compact) == shape(tree)
+    assert [leaf.root_path for leaf in compact.leaves] == [leaf.root_path for leaf in tree.leaves]
+    assert compact.height == tree.height
+    leaf = compact.leaves[0]
+    assert [node.name for node in leaf.path] == ["", 'a', 'b', 'p1'] and leaf.root == compact
+
+
+def test_compact_unlinks_any_child_and_recounts():
+    root = build(True)
+    store = root.tree
+    assert store.count() == (5, 7)
+    b = root.children[0].children[0]
+    middle, last = b.children[1], b.children[2]
+    middle.parent = None
+    assert [child.name for child in b.children] == ['p1', 'p3'] and middle.parent is None
+    last.parent = None
+    middle.parent = b
+    assert [child.name for child in b.children] == ['p1', 'p2']
+    assert store.count() == (4, 6)
+    b.parent = None
+    assert [child.name for child in root.children[0].children] == ['p4']
+    assert store.count() == (2, 3)
+
+
+def test_compact_and_anytree_load_the_same_tree(make_arguments, load_tree):
+    arguments = make_arguments('clone', '/tmp')
+    compact, tree = load_tree(arguments, compact=True), load_tree(arguments)
+    assert compact.count() == tree.count()
+    assert shape(compact.root) == shape(tree.root)
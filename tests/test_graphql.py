@@ -0,0 +1,57 @@
+import graphql
+from fakegitlab import blob_sha
+
+
+def test_batch_queries(org, make_arguments):
+    client = graphql.make_client(make_arguments('plugins', '--check', '--name=main'))
+    projects = org.projects[:10]
+    ids = [project['id'] for project in projects]
+    found = client.plugins_batch(ids, 'main')
+    for project in projects:
+        assert found[project['id']]['blob']['oid'] == blob_sha(org.variants[project['variant']])
+        assert found[project['id']]['languages'] == project['languages']
+    assert all(found['blob'] is None for found in client.plugins_batch(ids, 'missing').values())
+    assert client.languages_batch(ids) == {project['id']: project['languages'] for project in projects}
+    branches = client.branches_batch(ids, 'devsecops')
+    assert {id for id, names in branches.items() if names} == \
+        {project['id'] for project in projects if 'devsecops' in project['branches']}
+
+
+def test_graphql_plugins_check_matches_threads(org, make_arguments, load_tree, tmp_path, results):
+    def check(*options):
+        output = str(tmp_path / 'results{}.jsonl'.format(len(options)))
+        arguments = make_arguments('-o', output, '--output-format=jsonl', '--batch=7', *options)
+        load_tree(arguments).sync_tree('plugins', arguments)
+        return sorted((record['project'], record['lang'], record['status']) for record in results(output))
+    records = check('--graphql', '--lang-refresh', 'plugins', '--check', '--name=main')
+    assert len(records) == len(org.projects)
+    assert records == check('plugins', '--check', '--name=main')
+
+
+def test_graphql_branch_plan(org, make_arguments, load_tree, capsys):
+    arguments = make_arguments('--graphql', 'branch', '--create', '--name=devsecops', '--ref=main')
+    missing = sum('devsecops' not in project['branches'] for project in org.projects)
+    load_tree(arguments).sync_tree('branch', arguments)
+    assert capsys.readouterr().out.count('- create ') == missing
+    assert all('devsecops' in project['branches'] for project in org.projects)
+
+
+def test_graphql_records_a_broken_project_and_carries_on(org, make_arguments, load_tree, tmp_path, results):
+    # No languages and no variables leave nothing to pick the plugin language from
+    broken = org.projects[0]
+    broken['languages'] = {}
+    broken['files']['main'] = {'.gitlab-ci.yml': "build:\n  script:\n  - make\n"}
+    output = str(tmp_path / 'results.jsonl')
+    arguments = make_arguments('-o', output, '--output-format=jsonl', '--graphql', 'plugins', '--check', '--name=main')
+    load_tree(arguments).sync_tree('plugins', arguments)
+    records = results(output)
+    assert len({record['project'] for record in records}) == len(org.projects)
+    assert [record['status'] for record in records if record['project'] == broken['name']] == ['error']
+
+
+def test_batches_above_a_page_are_split(org, make_arguments, load_tree, tmp_path, results):
+    output = str(tmp_path / 'results.jsonl')
+    arguments = make_arguments('-o', output, '--output-format=jsonl', '--batch=150', '--graphql',
+                               'plugins', '--check', '--name=main')
+    load_tree(arguments).sync_tree('plugins', arguments)
+    assert {record['status'] for record in results(output)} == {'ok'}
@@ -0,0 +1,21 @@
+import index
+
+
+def run(make_arguments, load_tree, results, database, output, name='main'):
+    arguments = make_arguments('-o', output, '--output-format=jsonl', 'index', database, '--name={}'.format(name))
+    load_tree(arguments).sync_tree('index', arguments)
+    return sorted(result['status'] for result in results(output))
+
+
+def test_index_updates_refs_and_drops_projects_that_left(org, make_arguments, load_tree, results, tmp_path):
+    database = str(tmp_path / 'index.db')
+    assert run(make_arguments, load_tree, results, database, str(tmp_path / '1.jsonl')) == ['indexed'] * len(org.projects)
+    assert run(make_arguments, load_tree, results, database, str(tmp_path / '2.jsonl')) == ['unchanged'] * len(org.projects)
+    # Same CI file on the other branch, only the ref moves
+    assert run(make_arguments, load_tree, results, database, str(tmp_path / '3.jsonl'), 'feature-1') == \
+        ['unchanged'] * len(org.projects)
+    assert index.sql_query(database, "SELECT DISTINCT ref FROM projects")[1:] == [('feature-1',)]
+    left = org.projects.pop()
+    run(make_arguments, load_tree, results, database, str(tmp_path / '4.jsonl'), 'feature-1')
+    assert index.sql_query(database, "SELECT COUNT(*) FROM projects WHERE id = {}".format(left['id']))[1:] == [(0,)]
+    assert index.sql_query(database, "SELECT COUNT(*) FROM projects")[1:] == [(len(org.projects),)]
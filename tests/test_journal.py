@@ -0,0 +1,17 @@
+from anytree import Node
+from git import GitAction
+from journal import Journal
+
+
+def test_resume_from_a_compressed_journal(tmp_path):
+    path = str(tmp_path / 'journal.jsonl.gz')
+    arguments = {'--name': 'main'}
+    actions = [GitAction(Node('project-{}'.format(id), id=id), 'project-{}'.format(id), arguments)
+               for id in range(1, 4)]
+    journal = Journal(path, 'plugins', arguments)
+    journal.record(actions[0], 'ok')
+    journal.record(actions[1], 'error')
+    journal.close()
+    journal = Journal(path, 'plugins', arguments, resume=True)
+    journal.close()
+    assert journal.done == {1}
@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta, timezone
+import subprocess
+from anytree import Node
+from git import GitAction
+from gitproc import GitRunner
+from manifest import Manifest
+
+
+def repository(path):
+    subprocess.run(['git', 'init', '-q', str(path)], check=True)
+    subprocess.run(['git', '-C', str(path), '-c', 'user.name=test', '-c', 'user.email=test@localhost',
+                    'commit', '-q', '--allow-empty', '-m', 'init'], check=True)
+    return str(path)
+
+
+def test_recent_activity_is_confirmed_with_the_remote(tmp_path):
+    remote = repository(tmp_path / 'remote')
+    checkout = str(tmp_path / 'checkouts' / 'project')
+    subprocess.run(['git', 'clone', '-q', remote, checkout], check=True)
+    activity = (datetime.now(timezone.utc) - timedelta(minutes=5)).isoformat()
+    action = GitAction(Node('project', id=1, url=remote, last_activity_at=activity), checkout, {})
+    manifest = Manifest(str(tmp_path / 'checkouts'), GitRunner(timeout=60))
+    manifest.record(action)
+    assert manifest.is_synced(action)
+    # Pushed within the hour, gitlab leaves last_activity_at as it was
+    subprocess.run(['git', '-C', remote, '-c', 'user.name=test', '-c', 'user.email=test@localhost',
+                    'commit', '-q', '--allow-empty', '-m', 'push'], check=True)
+    assert not manifest.is_synced(action)
+    manifest.projects[1]['synced_at'] = (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
+    assert manifest.is_synced(action)
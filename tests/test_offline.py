@@ -0,0 +1,33 @@
+import subprocess
+import offline
+import pipeline
+
+COMMIT = ['-c', 'user.name=test', '-c', 'user.email=test@localhost', 'commit', '-q']
+
+
+def checkout(path, files):
+    subprocess.run(['git', 'init', '-q', '-b', 'main', str(path)], check=True)
+    for name, text in files.items():
+        (path / name).write_text(text)
+    subprocess.run(['git', '-C', str(path), 'add', '-A'], check=True)
+    subprocess.run(['git', '-C', str(path)] + COMMIT + ['--allow-empty', '-m', 'init'], check=True)
+    return str(path)
+
+
+def test_missing_ci_file_is_not_an_error(tmp_path):
+    pipeline.init_worker(16, None)
+    assert offline.audit_project(checkout(tmp_path / 'bare', {'Main.java': 'class Main {}\n'}), 'main') is None
+    lang, dump_file = offline.audit_project(checkout(tmp_path / 'ci', {
+        'Main.java': 'class Main {}\n', '.gitlab-ci.yml': 'build:\n  script:\n  - make\n'}), 'main')
+    assert lang == 'Java' and 'build' in dump_file
+
+
+def test_languages_stay_local_in_a_partial_clone(tmp_path):
+    origin = checkout(tmp_path / 'origin', {'Main.java': 'class Main {}\n', 'App.java': 'class App {}\n',
+                                            'run.py': 'print()\n', '.gitlab-ci.yml': 'build:\n  script:\n  - make\n'})
+    subprocess.run(['git', '-C', origin, 'config', 'uploadpack.allowFilter', 'true'], check=True)
+    mirror = str(tmp_path / 'mirror')
+    subprocess.run(['git', 'clone', '-q', '--filter=blob:none', '--no-checkout', 'file://' + origin, mirror], check=True)
+    # With the remote gone, anything that needs a missing blob fails
+    subprocess.run(['rm', '-rf', origin], check=True)
+    assert offline.languages(mirror, 'origin/main') == {'Java': 66.67, 'Python': 33.33}
@@ -0,0 +1,72 @@
+import pytest
+import git
+import pipeline
+
+
+def test_check_prints_resolved_includes(org, make_arguments, load_tree, capsys):
+    arguments = make_arguments('plugins', '--check', '--name=main', '--recursive')
+    load_tree(arguments).sync_tree('plugins', arguments)
+    out = capsys.readouterr().out
+    assert out.count('includes:') == len(org.projects)
+    assert '/templates/build.yml' in out and '❌' not in out
+
+
+def test_push_errors_are_recorded(make_arguments, load_tree, monkeypatch, tmp_path, results):
+    output = str(tmp_path / 'results.jsonl')
+    arguments = make_arguments('plugins', '--push', '--name=main', '-o', output, '--output-format=jsonl')
+
+    def broken(*args):
+        raise RuntimeError("broken")
+    monkeypatch.setattr(git, 'is_unchanged', broken)
+    tree = load_tree(arguments)
+    tree.sync_tree('plugins', arguments)
+    pushes = [result for result in results(output) if result['step'] == 'push']
+    assert len(pushes) == tree.count()[0]
+    assert all(result['status'] == 'error' for result in pushes)
+
+
+def test_sync_threads_maps_every_outcome(make_arguments, load_tree, monkeypatch):
+    arguments = make_arguments('clone', '/tmp')
+    actions = list(git.get_git_actions(load_tree(arguments).root, '/tmp', arguments))[:3]
+    outcomes = dict(zip((action.node.id for action in actions), (True, False, None)))
+    finished = {}
+    monkeypatch.setattr(git, 'finish', lambda action, status: finished.update({action.node.id: status}))
+    pipeline.sync_threads(actions, lambda action: outcomes[action.node.id], arguments, 'clone')
+    assert sorted(finished.values()) == ['error', 'ok', 'skip']
+
+
+def test_push_creates_the_branch_and_leaves_the_ref_alone(org, make_arguments, load_tree, tmp_path, results):
+    def push(number):
+        output = str(tmp_path / 'push{}.jsonl'.format(number))
+        arguments = make_arguments('plugins', '--push', '--name=revisor', '--ref=main', '-o', output,
+                                   '--output-format=jsonl')
+        load_tree(arguments).sync_tree('plugins', arguments)
+        return {result['status'] for result in results(output) if result['step'] == 'push'}
+    assert 'ok' in push(1)
+    pushed = [project for project in org.projects if project['files'].get('revisor')]
+    assert pushed and all('revisor' in project['branches'] for project in pushed)
+    assert not any(project['files'].get('main') for project in org.projects)
+    assert push(2) == {'unchanged'}
+
+
+@pytest.mark.parametrize('engine', ['--engine=threads', '--engine=async', '--graphql'])
+def test_every_engine_reports_a_missing_ci_file(org, make_arguments, load_tree, tmp_path, engine, results):
+    output = str(tmp_path / 'results.jsonl')
+    arguments = make_arguments(engine, '-o', output, '--output-format=jsonl', 'plugins', '--check', '--name=nope')
+    load_tree(arguments).sync_tree('plugins', arguments)
+    assert {(result['step'], result['status']) for result in results(output)} == {('plugins', 'missing')}
+    assert len(results(output)) == len(org.projects)
+
+
+def test_rendered_blobs_skip_the_workers(org, make_arguments, load_tree, monkeypatch, capsys):
+    arguments = make_arguments('plugins', '--check', '--name=main')
+    tree = load_tree(arguments)
+    tree.sync_tree('plugins', arguments)
+    first = capsys.readouterr().out
+    submitted = []
+    transform_submit = pipeline.transform_submit
+    monkeypatch.setattr(pipeline, 'transform_submit', lambda cpu_pool, item: submitted.append(item[1][4] is None)
+                        or transform_submit(cpu_pool, item))
+    tree.sync_tree('plugins', arguments)
+    assert len(submitted) == len(org.projects) and not any(submitted)
+    assert capsys.readouterr().out == first
@@ -0,0 +1,12 @@
+import time
+from scheduler import RateScheduler
+
+
+def test_no_pacing_until_gitlab_sends_its_rate_limit():
+    scheduler = RateScheduler()
+    assert scheduler.reserve() == scheduler.reserve() == 0
+    scheduler.observe(200, {'RateLimit-Remaining': 'many', 'RateLimit-Reset': str(time.time() + 60)})
+    assert scheduler.reserve() == 0
+    scheduler.observe(200, {'RateLimit-Remaining': '60', 'RateLimit-Reset': str(time.time() + 60)})
+    scheduler.reserve()
+    assert 0.5 < scheduler.reserve() <= 1.0
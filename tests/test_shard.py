@@ -0,0 +1,47 @@
+import pytest
+from shard import Shard, merge
+from sink import open_text
+
+
+def test_parse_accepts_only_a_slice_of_the_total():
+    shard = Shard.parse('2/4')
+    assert (shard.index, shard.total) == (2, 4)
+    for text in ('0/4', '5/4', '1', 'a/b', None):
+        with pytest.raises(ValueError):
+            Shard.parse(text)
+
+
+def test_shard_paths_keep_every_suffix():
+    shard = Shard(2, 4)
+    assert shard.path('results.csv.gz') == 'results.2-of-4.csv.gz'
+    assert shard.path('out.d/journal.jsonl') == 'out.d/journal.2-of-4.jsonl'
+    assert shard.path('results') == 'results.2-of-4'
+
+
+def test_every_project_has_exactly_one_shard(org, make_arguments, load_tree):
+    def owners(compact):
+        leaves = load_tree(make_arguments('clone', '/tmp'), compact=compact).root.leaves
+        return {leaf.root_path: [index for index in range(1, 5) if Shard(index, 4).owns(leaf)] for leaf in leaves}
+    owned = owners(False)
+    assert len(owned) == len(org.projects)
+    assert all(len(shards) == 1 for shards in owned.values())
+    assert {shards[0] for shards in owned.values()} == {1, 2, 3, 4}
+    # The split only depends on the project, not on the store holding the tree
+    assert owners(True) == owned
+
+
+def test_sharded_runs_merge_into_the_whole_run(org, make_arguments, load_tree, results, tmp_path):
+    inputs = []
+    for index in (1, 2, 3):
+        output = str(tmp_path / 'results.csv.gz')
+        arguments = make_arguments('-o', output, 'plugins', '--check', '--name=main')
+        arguments["shard"] = Shard(index, 3)
+        load_tree(arguments).sync_tree('plugins', arguments)
+        inputs.append(arguments["shard"].path(output))
+    merged = str(tmp_path / 'merged.jsonl')
+    statuses = merge(merged, inputs)
+    records = results(merged)
+    assert sorted(record['project'] for record in records) == sorted(project['name'] for project in org.projects)
+    assert statuses == {'ok': len(org.projects)}
+    with open_text(inputs[0], 'r') as stream:
+        assert stream.read().count('\n') < len(org.projects)
@@ -0,0 +1,25 @@
+import json
+import pytest
+import sink
+from sink import ResultSink
+
+
+def test_push_raises_when_the_writer_died(tmp_path, monkeypatch):
+    monkeypatch.setattr(sink, 'PUT_TIMEOUT', 0.01)
+    results = ResultSink(str(tmp_path / 'missing' / 'results.csv'), queue_size=2).start()
+    with pytest.raises(FileNotFoundError):
+        for number in range(10):
+            results.push({'project': number})
+    with pytest.raises(FileNotFoundError):
+        results.close()
+
+
+def test_close_writes_every_record(tmp_path):
+    path = tmp_path / 'results.jsonl.gz'
+    results = ResultSink(str(path), 'jsonl', queue_size=2).start()
+    for number in range(100):
+        results.push({'project': number})
+    results.close()
+    assert results.written == 100
+    with sink.open_text(str(path), 'r') as stream:
+        assert [json.loads(line)['project'] for line in stream] == list(range(100))
@@ -0,0 +1,19 @@
+def test_flat_and_crawl_load_every_project(org, make_arguments, load_tree):
+    arguments = make_arguments('clone', '/tmp')
+    crawled = load_tree(arguments).count()[0]
+    flat = load_tree(arguments, flat=True).count()[0]
+    assert crawled == flat == len(org.projects)
+
+
+def test_cache_keeps_projects_of_a_renamed_group(org, make_arguments, load_tree, tmp_path):
+    arguments = make_arguments('clone', '/tmp')
+    cache = str(tmp_path / 'snapshot.yaml')
+    assert load_tree(arguments, cache=cache).count()[0] == len(org.projects)
+    group = org.groups[0]
+    for other in org.groups:
+        if other['full_path'].startswith(group['full_path']):
+            other['full_path'] = 'renamed' + other['full_path'][len(group['full_path']):]
+    group['name'] = group['path'] = 'renamed'
+    tree = load_tree(arguments, cache=cache)
+    assert tree.count()[0] == len(org.projects)
+    assert [child.name for child in tree.root.children] == ['renamed']
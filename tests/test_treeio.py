@@ -0,0 +1,58 @@
+import io
+import json
+import yaml
+import pytest
+from anytree.exporter import DictExporter
+import treeio
+
+WRITERS = {'yaml': treeio.write_yaml, 'json': treeio.write_json, 'jsonl': treeio.write_jsonl}
+
+
+def shape(root):
+    return [(node.root_path, getattr(node, 'id', -1), node.url, getattr(node, 'last_activity_at', None), node.depth)
+            for node in (root,) + tuple(root.descendants)]
+
+
+def written(root, format):
+    stream = io.StringIO()
+    WRITERS[format](root, stream)
+    return stream.getvalue()
+
+
+@pytest.mark.parametrize('compact', [False, True])
+@pytest.mark.parametrize('format', sorted(WRITERS))
+def test_snapshot_round_trips(make_arguments, load_tree, tmp_path, format, compact):
+    arguments = make_arguments('clone', '/tmp')
+    tree = load_tree(arguments, compact=compact)
+    path = tmp_path / 'tree.{}'.format(format)
+    path.write_text(written(tree.root, format))
+    loaded = load_tree(arguments, in_file=str(path), compact=compact)
+    assert loaded.count() == tree.count()
+    assert shape(loaded.root) == shape(tree.root)
+
+
+@pytest.mark.parametrize('format', sorted(WRITERS))
+def test_both_stores_write_the_same_snapshot(make_arguments, load_tree, format):
+    arguments = make_arguments('clone', '/tmp')
+    assert written(load_tree(arguments, compact=True).root, format) == written(load_tree(arguments).root, format)
+
+
+def test_streamed_documents_match_the_exporter(make_arguments, load_tree):
+    root = load_tree(make_arguments('clone', '/tmp')).root
+    exported = DictExporter().export(root)
+    assert yaml.safe_load(written(root, 'yaml')) == exported
+    assert json.loads(written(root, 'json')) == exported
+
+
+def test_long_and_quoted_values_survive(make_arguments, load_tree, tmp_path):
+    arguments = make_arguments('clone', '/tmp')
+    tree = load_tree(arguments)
+    leaf = tree.root.leaves[0]
+    leaf.url = 'https://gitlab.example.com/' + 'x' * 300
+    leaf.parent.name = 'with: colon # and hash'
+    for format in sorted(WRITERS):
+        path = tmp_path / 'tree.{}'.format(format)
+        path.write_text(written(tree.root, format))
+        loaded = load_tree(arguments, in_file=str(path))
+        assert [node.url for node in loaded.root.leaves] == [node.url for node in tree.root.leaves]
+        assert {node.name for node in loaded.root.descendants} == {node.name for node in tree.root.descendants}